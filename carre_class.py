@@ -1,7 +1,24 @@
 import math
+import os
+import json
+import copy
+import hashlib
+import inspect
+import linecache
+import time
+import multiprocessing
+import shutil
+import subprocess
+import tempfile
+import threading
+import queue
+import zipfile
+from multiprocessing import shared_memory
+from collections import OrderedDict
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.animation as anime
+from matplotlib.collections import LineCollection
 import sympy as sp
 
 
@@ -16,7 +33,9 @@ class DiffeoInfini:
         ex=fonc_diff_infini(expr,(x,y))
     """
 
-    def __init__(self, expr, expr_reci=None, t0=-1., t1=1., snb=None, vars_sym=(sp.symbols("x y"))):
+    def __init__(self, expr, expr_reci=None, t0=-1., t1=1., snb=None, vars_sym=(sp.symbols("x y")), fusion=False,
+                 dossier_cache=None, budget_cache=512 * 1024 * 1024, tuile=None, processus=None, transfert_max=None,
+                 dossier_traces=None):
         """
         Pour creer une instance d'un diffeomorphisme de I^2 a I^2, il faut donner son expression mathematique,
         c'est-a-dire, une expression symbolique, ou on represente ses deux variables par x et y par default, et il faut
@@ -29,6 +48,21 @@ class DiffeoInfini:
         :param snb: nombre de l'échantillonnage par default sur une dimention. Ex. t0=-1, t1=1, snb=5, alors I = [-1, 1]
                     sera echantillonne par [-1, -0.5, 0, -0.5, 1]
         :param vars_sym: les symboles qui representent les deux variables du diffeomorphisme
+        :param fusion: si True, on compile aussi un seul noyau qui calcule f et df ensemble, en ne calculant qu'une
+                       fois les sous-expressions communes (voir f_df)
+        :param dossier_cache: si on le donne, les noyaux compiles sont gardes sur le disque dans ce dossier (voir
+                              CacheNoyaux), et une deuxieme construction du meme diffeomorphisme ne refait ni sp.diff ni
+                              sp.lambdify
+        :param budget_cache: memoire maximale (en octets) des tableaux gardes dans cache_grilles
+        :param tuile: si on le donne, les tableaux sur le plan (tab_f, tab_df, ...) sont calcules par tuiles de
+                      tuile * tuile points, voir __evaluer
+        :param processus: si on le donne (> 1), les tableaux sur le plan sont calcules par bandes de lignes dans
+                          autant de processus, qui ecrivent directement dans des TableauPartage, voir __evaluer
+        :param transfert_max: taille maximale (en octets) d'un resultat de cache_grilles transmis quand on pickle le
+                              diffeomorphisme, voir __getstate__ ; None pour tout transmettre
+        :param dossier_traces: si on le donne, chaque resultat de trace (et de trace_many) est garde sur le disque dans
+                               ce dossier (voir CacheTraces) : un rendu interrompu, ou refait avec un autre style, ne
+                               retrace pas les images deja tracees
         """
         """
         ((*) signifier cette variable peut etre None, (#)signifier cette variable devient None si l'interval est change)
@@ -44,46 +78,168 @@ class DiffeoInfini:
         self.__expr_reci = expr_reci
         self.__t0, self.__t1 = t0, t1
         self.__x, self.__y = vars_sym
-        self.__num = sp.lambdify((self.__x, self.__y), self.__expr, "numpy")
-        self.__num_reci = sp.lambdify((self.__x, self.__y), self.__expr_reci,
-                                      "numpy") if self.__expr_reci is not None else None
         """
         Variables sur le differentiel :
         __df_sym: l'expression symbolique du differentiel de ce diffeomorphisme
-        __df_num: la fonction de python correspondant a df_sym
+        __df_num: la fonction de python correspondant a df_sym, qui retourne la liste a plat de ses quatre composantes
+                  (une composante constante revient comme un scalaire), voir Jacobienne
         __df_reci_sym: (*)l'expression symbolique du differentiel du diffeomorphisme reciproque
         __df_reci_num: (*)la fonction de python correspondant a df_reci_sym
+        __f_df_num: (*)la fonction de python qui calcule f et df en une seule passe, avec elimination des
+                    sous-expressions communes. None si fusion est False
+        Si les noyaux viennent du cache sur le disque, __df_sym et __df_reci_sym ne sont reconstruits (a partir de
+        leur srepr) que quand on les demande, voir gdfsym.
+        """
+        cache, cle, sources = None, None, None
+        if dossier_cache is not None:
+            cache = CacheNoyaux(dossier_cache)
+            cle = cache.cle(self.__expr, self.__expr_reci, vars_sym, "numpy", fusion)
+            sources = cache.charger(cle)
+        if sources is None:
+            self.__compiler(fusion)
+            if cache is not None:
+                cache.sauver(cle, self.__sources())
+        else:
+            self.__charger(sources)
+        """
+        Variables sur les resultats sous forme de tableau :
+        snb: nombre de l'échantillonnage par default sur une dimention
+        tuile: (*)cote des tuiles pour calculer les tableaux sur le plan, None pour tout calculer en un seul appel
+        processus: (*)nombre de processus pour calculer les tableaux sur le plan, None pour n'en utiliser qu'un
+        cache_traces: (*)le cache sur le disque des resultats de trace, voir CacheTraces
+        cache_grilles: le cache LRU (voir CacheGrilles) de tous les resultats sous forme de tableau, chacun range sous
+                       la cle (quantite, snb, t0, t1, multi, ...). On y trouve :
+            "plan": meshes grid d'un plan, sous forme de meshgrid en 3 dimentions: (x ou y, ligne, colonne)
+            "tab_f": f(plan), sous meme forme que plan
+            "tab_df": df(plan), sous forme de meshgrid en 4 dimenttions: (∂f1 ou ∂f2, ∂x ou ∂y, ligne, colonne)
+            "tab_f_df": (tab_f, tab_df) calcules ensemble, avec l'option fusion
+            "tab_points_reci": f(tab_points_reci) ≈ plan, sous meme forme que plan
+            "tab_f_points_reci": f(tab_points_reci), sous meme forme que plan
+            "tab_df_points_reci": df(tab_points_reci), sous meme forme que plan
+            "tab_f_df_points_reci": (tab_f_points_reci, tab_df_points_reci) calcules ensemble, avec l'option fusion
+            "tab_angles_R": les angles calcules a partir de tab_df_points_reci, sous forme de meshgrid en 3 dimentions:
+                            (horizontal ou vertical, ligne, colonne)
+            "champ_angles": l'interpolateur de tab_angles_R utilise par trace, voir ChampAngles
+        deroulement: (*)le deroulement des angles du champ utilise par trace, voir tab_angles_R
+        _points_reci_charges: (*)(t0, t1, tableau) les antecedents charges par load_points_reci ; ils ne sont jamais
+                              evinces du cache
+        _empreinte_reci: (*)le hash des antecedents charges, pour les cles de cache_traces
+        info_trace: (*)les statistiques du dernier appel a trace : nombre de pas acceptes, rejetes, et d'evaluations
+                    d'angle
+        info_images: (*)les images cles et les erreurs estimees du dernier appel a trace_images
+        info_pipeline: (*)les statistiques par etage du dernier appel a render_pipeline, voir Pipeline.stats
+        info_inverse: (*)le rapport du dernier calcul de _tab_points_reci par inverse_newton : masque des points qui
+                      ont converge, et residus
         """
+        self.snb = snb or int((t1 - t0) * 25)
+        self.tuile = tuile
+        self.processus = processus
+        self.cache_grilles = CacheGrilles(budget_cache, transfert_max)
+        self.cache_traces = None
+        if dossier_traces is not None:
+            self.cache_traces = CacheTraces(dossier_traces, self.__expr, self.__expr_reci, vars_sym)
+        self.deroulement = "lignes"
+        self._points_reci_charges = None
+        self._empreinte_reci = None
+        self.info_trace = None
+        self.info_inverse = None
+        self.info_images = None
+        self.info_pipeline = None
+
+    def __compiler(self, fusion):
+        """
+        Calculer les differentiels symboliques et compiler tous les noyaux par sp.lambdify
+        :param fusion: voir __init__
+        """
+        self.__num = sp.lambdify((self.__x, self.__y), self.__expr, "numpy")
+        self.__num_reci = sp.lambdify((self.__x, self.__y), self.__expr_reci,
+                                      "numpy") if self.__expr_reci is not None else None
         self.__df_sym = self.df_dim2_sym(self.__expr, self.__x, self.__y)
-        self.__df_num = sp.lambdify((self.__x, self.__y), self.__df_sym, "numpy")
+        self.__df_num = sp.lambdify((self.__x, self.__y), list(self.__df_sym), "numpy")
         self.__df_reci_sym = self.df_dim2_sym(self.__expr_reci, self.__x,
                                               self.__y) if self.__expr_reci is not None else None
         self.__df_reci_num = sp.lambdify((self.__x, self.__y), self.__df_reci_sym,
                                          "numpy") if self.__df_reci_sym is not None else None
+        self.__f_df_num = sp.lambdify((self.__x, self.__y), list(self.__expr) + list(self.__df_sym), "numpy",
+                                      cse=True) if fusion else None
+        self.__df_srepr = None
+
+    def __sources(self):
         """
-        Variables sur les resultats sous forme de tableau :
-        snb: nombre de l'échantillonnage par default sur une dimention
-        _plan: (#)meshes grid d'un plan, sous forme de meshgrid en 3 dimentions: (x ou y, ligne, colonne)
-        _tab_f: (#)f(_plan), sous meme forme que _plan
-        _tab_df: (#)df(_plan), sous forme de meshgrid en 4 dimenttions: (∂f1 ou ∂f2, ∂x ou ∂y, ligne, colonne)
-        _tab_points_reci: (#)f(_tab_points_reci) ≈ _plan, sous meme forme que plan
-        _tab_f_points_reci: (#)f(_tab_points_reci), sous meme forme que plan
-        _tab_df_points_reci: (#)df(_tab_points_reci), sous meme forme que plan
-        _tab_angles_R: (#)les angles calcules a partir de _tab_df_points_reci, sous forme de meshgrid en 3 dimentions:
-                        (horizontal ou vertical, ligne, colonne)
+        :return: dict des codes sources des noyaux compiles et des srepr des differentiels, pour CacheNoyaux
         """
-        self.snb = snb or int((t1 - t0) * 25)
-        self._plan = None
-        self._tab_f = None
-        self._tab_df = None
-        self._tab_points_reci = None
-        self._tab_f_points_reci = None
-        self._tab_df_points_reci = None
-        self._tab_angles_R = None
+        return {"num": inspect.getsource(self.__num),
+                "num_reci": inspect.getsource(self.__num_reci) if self.__num_reci is not None else None,
+                "df_num": inspect.getsource(self.__df_num),
+                "df_reci_num": inspect.getsource(self.__df_reci_num) if self.__df_reci_num is not None else None,
+                "f_df_num": inspect.getsource(self.__f_df_num) if self.__f_df_num is not None else None,
+                "df_sym": sp.srepr(self.__df_sym) if self.__df_srepr is None else self.__df_srepr[0],
+                "df_reci_sym": (sp.srepr(self.__df_reci_sym) if self.__df_reci_sym is not None else None)
+                if self.__df_srepr is None else self.__df_srepr[1]}
+
+    def __charger(self, sources):
+        """
+        Reprendre les noyaux depuis leurs codes sources, sans aucun calcul de sympy
+        :param sources: dict comme retourne par __sources
+        """
+        compiler = CacheNoyaux.compiler
+        self.__num = compiler(sources["num"])
+        self.__num_reci = compiler(sources["num_reci"]) if sources["num_reci"] is not None else None
+        self.__df_num = compiler(sources["df_num"])
+        self.__df_reci_num = compiler(sources["df_reci_num"]) if sources["df_reci_num"] is not None else None
+        self.__f_df_num = compiler(sources["f_df_num"]) if sources["f_df_num"] is not None else None
+        self.__df_sym, self.__df_reci_sym = None, None
+        self.__df_srepr = (sources["df_sym"], sources["df_reci_sym"])
+
+    # les attributs des noyaux compiles, qui ne se picklent pas
+    __NOYAUX = ("_DiffeoInfini__num", "_DiffeoInfini__num_reci", "_DiffeoInfini__df_num", "_DiffeoInfini__df_reci_num",
+                "_DiffeoInfini__f_df_num")
+
+    def __getstate__(self):
+        """
+        Pour pickle, par ex. pour envoyer le diffeomorphisme a des processus de multiprocessing : les noyaux compiles
+        ne se picklent pas, on transmet a leur place leurs codes sources (voir __sources), et les differentiels
+        symboliques par leur srepr. Les resultats de cache_grilles sont transmis selon CacheGrilles.__getstate__ :
+        ceux qui sont en memoire partagee (voir partager_grilles) par leur nom seulement, les autres s'ils ne
+        depassent pas transfert_max.
+        :return: dict
+        """
+        etat = self.__dict__.copy()
+        sources = etat.pop("_DiffeoInfini__sources_differees", None) or self.__sources()
+        for nom in self.__NOYAUX:
+            etat.pop(nom, None)
+        etat["_DiffeoInfini__df_sym"], etat["_DiffeoInfini__df_reci_sym"] = None, None
+        etat["_DiffeoInfini__df_srepr"] = (sources["df_sym"], sources["df_reci_sym"])
+        etat["_DiffeoInfini__sources_differees"] = sources
+        return etat
+
+    def __setstate__(self, etat):
+        """
+        Les noyaux ne sont recompiles (sans sympy, voir __charger) qu'a leur premiere utilisation, voir __getattr__
+        """
+        self.__dict__.update(etat)
+
+    def __getattr__(self, nom):
+        sources = self.__dict__.get("_DiffeoInfini__sources_differees")
+        if sources is None or nom not in self.__NOYAUX:
+            raise AttributeError(nom)
+        del self.__dict__["_DiffeoInfini__sources_differees"]
+        self.__charger(sources)
+        return self.__dict__[nom]
+
+    def partager_grilles(self, taille_min=1024 * 1024):
+        """
+        Mettre en memoire partagee (voir TableauPartage) les tableaux de cache_grilles d'au moins taille_min octets :
+        quand on picklera le diffeomorphisme, ils seront transmis par leur nom, sans copie. Ils doivent rester en vie
+        dans ce processus tant que les autres processus ne les ont pas ouverts.
+        :param taille_min: int
+        """
+        self.cache_grilles.partager(taille_min)
 
     def change_domain(self, t0=None, t1=None):
         """
-        Changer le domaine du diffeomorphisme, et changer les donnees qui le consernent
+        Changer le domaine du diffeomorphisme. Les donnees deja calculees restent dans le cache sous les cles de
+        l'ancien domaine, on les retrouve si on revient a celui-ci
         :param t0: float
         :param t1: float
         :return: boolean : True si le domaine est change, False sinon
@@ -95,27 +251,95 @@ class DiffeoInfini:
         if t1 is not None and t1 != self.__t1:
             self.__t1 = t1
             flag = True
-        if flag:
-            self._plan = None
-            self._tab_points_reci = None
-            self._tab_f = None
-            self._tab_df = None
-            self._tab_angles_R = None
         return flag
 
-    def plan(self, snb=None):
+    def __cle(self, quantite, taille, multi=None, *options):
+        """
+        :return: la cle de quantite dans cache_grilles : (quantite, snb, t0, t1, multi, options...)
+        """
+        return (quantite, taille, self.__t0, self.__t1, multi) + options
+
+    def plan(self, snb=None, creux=False):
         """
         Retourner deux tableaux qui sont les 'rastérisations' (feuillages) d'un plan traitees par numpy.meshgrid.
         Attention, la structure de ces deux tableaux sont specifiques. Veuilliez-vous afficher ces deux tableaux pour
         la connaitre. C'est pour faciliter le calcul d'apres.
+        On ne garde que les deux axes, sous forme creuse (une ligne (1, snb) pour x, une colonne (snb, 1) pour y), soit
+        O(snb) en memoire. Sans creux, on les etend en (snb, snb) par numpy.broadcast_arrays, sans copie : les
+        tableaux retournes sont alors en lecture seule.
         :param snb: int
+        :param creux: si True, retourner les deux axes creux, que numpy etend tout seul dans les calculs
         :return: [x ou y, ligne, colonne]
         """
         taille = snb or self.snb
-        if self._plan is None or taille != len(self._plan):
+
+        def calcul():
             axe = np.linspace(self.__t0, self.__t1, taille)
-            self._plan = np.meshgrid(axe, axe)
-        return self._plan
+            return np.meshgrid(axe, axe, sparse=True)
+
+        axe_x, axe_y = self.cache_grilles.obtenir(self.__cle("plan", taille), calcul)
+        if creux:
+            return axe_x, axe_y
+        return np.broadcast_arrays(axe_x, axe_y)
+
+    @staticmethod
+    def __etendre(valeurs, forme):
+        """
+        Etendre a la forme donnee (sans copie) les valeurs qui n'en dependent pas de tous les axes
+        :param valeurs: tuple de scalaires ou de tableaux
+        :return: tuple de tableaux de forme forme
+        """
+        return tuple(v if np.shape(v) == forme else np.broadcast_to(v, forme) for v in valeurs)
+
+    def __evaluer(self, noyau, tab_x, tab_y, forme):
+        """
+        Evaluer noyau sur (tab_x, tab_y), qui s'etendent a forme.
+        Si self.tuile est donne, on remplit tuile par tuile des tableaux alloues une seule fois : numpy ne cree alors
+        ses tableaux intermediaires que sur une tuile, et la memoire maximale reste proche de celle des resultats, meme
+        pour un tres grand snb.
+        Si self.processus est donne, on partage les lignes en bandes calculees chacune par un processus, qui ecrit
+        directement dans les resultats, alloues en memoire partagee (voir TableauPartage) : rien n'est copie au retour.
+        :param noyau: un noyau compile par sp.lambdify, qui retourne une liste de valeurs
+        :param tab_x: numpy.array, de forme forme ou creuse (1, colonne) ou (ligne, 1)
+        :param tab_y: numpy.array, idem
+        :param forme: (ligne, colonne)
+        :return: liste des valeurs ; une valeur constante reste un scalaire
+        """
+        parallele = self.processus is not None and self.processus > 1 and forme[0] >= 2 * self.processus
+        tuile = self.tuile or max(forme)
+        if not parallele and forme[0] <= tuile and forme[1] <= tuile:
+            return list(noyau(tab_x, tab_y))
+        # un essai sur un seul point donne le nombre de valeurs et leurs types ; une expression constante donne un
+        # scalaire en tout point
+        essai = noyau(tab_x[:1, :1], tab_y[:1, :1])
+        if not parallele:
+            sorties = [v if np.ndim(v) == 0 else np.empty(forme, dtype=np.result_type(v)) for v in essai]
+            _remplir_par_tuiles(noyau, tab_x, tab_y, sorties, tuile)
+            return sorties
+        sorties = [v if np.ndim(v) == 0 else TableauPartage.creer(forme, np.result_type(v)) for v in essai]
+        noms = [None if np.ndim(v) == 0 else v.base.memoire.name for v in sorties]
+        source = inspect.getsource(noyau)
+        bornes = np.linspace(0, forme[0], 2 * self.processus + 1).astype(int)
+        taches = []
+        for debut, fin in zip(bornes[:-1], bornes[1:]):
+            # seules les lignes de la bande sont envoyees au processus
+            morceaux = [tab[debut:fin] if tab.shape[0] > 1 else tab for tab in (tab_x, tab_y)]
+            taches.append((source, morceaux[0], morceaux[1], noms, forme, debut, fin, tuile))
+        with multiprocessing.Pool(self.processus) as pool:
+            pool.starmap(_evaluer_bande, taches)
+        return sorties
+
+    def __tab_f_df(self, tab_x, tab_y, forme):
+        """
+        Calculer f et df sur (tab_x, tab_y) par __evaluer, avec le noyau fusionne s'il existe
+        :return: ((f1, f2), Jacobienne), voir f_df
+        """
+        if self.__f_df_num is None:
+            f1, f2 = self.__evaluer(self.__num, tab_x, tab_y, forme)
+            a, b, c, d = self.__evaluer(self.__df_num, tab_x, tab_y, forme)
+        else:
+            f1, f2, a, b, c, d = self.__evaluer(self.__f_df_num, tab_x, tab_y, forme)
+        return self.__etendre((f1, f2), forme), Jacobienne([a, b, c, d], forme)
 
     @staticmethod
     def df_dim2_sym(expr, sym_x, sym_y):
@@ -141,11 +365,14 @@ class DiffeoInfini:
         :return: [x ou y, ligne, colonne]
         """
         taille = snb or self.snb
-        if self._tab_f is None or taille != len(self._tab_f[0]):
-            axe_x, axe_y = self.plan(taille)
-            tab_x, tab_y = self.__num(axe_x, axe_y)
-            self._tab_f = (tab_x, tab_y)
-        return self._tab_f
+        if self.__f_df_num is not None:
+            return self.tab_f_df(taille)[0]
+
+        def calcul():
+            axe_x, axe_y = self.plan(taille, creux=True)
+            return self.__etendre(self.__evaluer(self.__num, axe_x, axe_y, (taille, taille)), (taille, taille))
+
+        return self.cache_grilles.obtenir(self.__cle("tab_f", taille), calcul)
 
     def tab_df(self, snb=None):
         """
@@ -153,15 +380,33 @@ class DiffeoInfini:
         jacobienne de chaque point dans le plan.
         Attention, le resultat retourne est en la structure de meshgrid. Voir detailles dans la partie ":return"
         :param snb: int
-        :return: le resultat est en numpy.array. Soit [[a,b],[c,d]] la matrice jacobienne du diffeomorphisme dans
+        :return: le resultat est une Jacobienne. Soit [[a,b],[c,d]] la matrice jacobienne du diffeomorphisme dans
         un point, resultat[0][0] contient les a de chaque point ET DANS LA TRUCTURE DE numpy.meshgrid. De meme,
         resultat[0][1] contient les c, resultat[1][0] contient les b, et resultat[1][1] contient les d.
         """
         taille = snb or self.snb
-        if self._tab_df is None or taille != len(self._tab_df[0][0]):
-            axe_x, axe_y = self.plan(taille)
-            self._tab_df = self.__df_num(axe_x, axe_y)
-        return self._tab_df
+        if self.__f_df_num is not None:
+            return self.tab_f_df(taille)[1]
+
+        def calcul():
+            axe_x, axe_y = self.plan(taille, creux=True)
+            return Jacobienne(self.__evaluer(self.__df_num, axe_x, axe_y, (taille, taille)), (taille, taille))
+
+        return self.cache_grilles.obtenir(self.__cle("tab_df", taille), calcul)
+
+    def tab_f_df(self, snb=None):
+        """
+        Calculer tab_f et tab_df en une seule passe (voir f_df), et les garder tous les deux
+        :param snb: int
+        :return: (tab_f, tab_df)
+        """
+        taille = snb or self.snb
+
+        def calcul():
+            axe_x, axe_y = self.plan(taille, creux=True)
+            return self.__tab_f_df(axe_x, axe_y, (taille, taille))
+
+        return self.cache_grilles.obtenir(self.__cle("tab_f_df", taille), calcul)
 
     def f_reci(self, x_num, y_num):
         """
@@ -173,14 +418,74 @@ class DiffeoInfini:
         if self.__num_reci is not None:
             return self.__num_reci(x_num, y_num)
         else:
-            return None
+            tab_x, tab_y, converge, residu = self.inverse_newton(x_num, y_num)
+            if not np.all(converge):
+                return None
+            return (float(tab_x), float(tab_y)) if np.ndim(tab_x) == 0 else (tab_x, tab_y)
+
+    def inverse_newton(self, tab_x, tab_y, depart=None, nb_iter=50, tolerance=1e-12):
+        """
+        Calculer f^-1 en tous les points de (tab_x, tab_y) a la fois, par la methode de Newton amortie : on resout
+        f(p) = cible par p <- p - l * df(p)^-1 (f(p) - cible), ou l est divise par 2 tant que le residu |f(p) - cible|
+        n'a pas diminue. Seuls les points qui n'ont pas encore converge sont recalcules a chaque iteration.
+        :param tab_x: float ou numpy.array, abscisses des points cibles
+        :param tab_y: float ou numpy.array, ordonnees des points cibles
+        :param depart: (depart_x, depart_y) les points de depart de Newton, (tab_x, tab_y) par default, ce qui suffit
+                       quand le diffeomorphisme est proche de l'identite
+        :param nb_iter: nombre maximal d'iterations
+        :param tolerance: residu en-dessous duquel un point a converge
+        :return: (inv_x, inv_y, converge, residu) de meme forme que tab_x : les antecedents, le masque des points qui
+                 ont converge, et le residu |f(inv) - cible| de chaque point
+        """
+        forme = np.shape(tab_x)
+        cible_x = np.array(tab_x, dtype=float).ravel()
+        cible_y = np.array(tab_y, dtype=float).ravel()
+        depart_x, depart_y = depart if depart is not None else (cible_x, cible_y)
+        px = np.array(depart_x, dtype=float).ravel()
+        py = np.array(depart_y, dtype=float).ravel()
+
+        def residu_de(x_, y_, ind):
+            fx, fy = self.__num(x_, y_)
+            return fx - cible_x[ind], fy - cible_y[ind]
+
+        rx, ry = residu_de(px, py, slice(None))
+        residu = np.hypot(rx, ry)
+        actif = np.nonzero(~(residu <= tolerance))[0]
+        for _ in range(nb_iter):
+            if len(actif) == 0:
+                break
+            x_, y_, rx_, ry_, res_ = px[actif], py[actif], rx[actif], ry[actif], residu[actif]
+            # les composantes constantes restent des scalaires
+            a, b, c, d = self.__df_num(x_, y_)
+            det = a * d - b * c
+            dx = (d * rx_ - b * ry_) / det
+            dy = (a * ry_ - c * rx_) / det
+            pas = np.ones(len(actif))
+            for _ in range(10):
+                nx, ny = x_ - pas * dx, y_ - pas * dy
+                nrx, nry = residu_de(nx, ny, actif)
+                nres = np.hypot(nrx, nry)
+                pire = ~(nres < res_)
+                if not pire.any():
+                    break
+                pas[pire] /= 2
+            # si meme le plus petit pas n'ameliore pas, on ne bouge pas ce point
+            mieux = nres < res_
+            ind = actif[mieux]
+            px[ind], py[ind], rx[ind], ry[ind], residu[ind] = nx[mieux], ny[mieux], nrx[mieux], nry[mieux], nres[mieux]
+            actif = ind[~(residu[ind] <= tolerance)]
+        converge = residu <= tolerance
+        return px.reshape(forme), py.reshape(forme), converge.reshape(forme), residu.reshape(forme)
 
     def load_points_reci(self, path, t0, t1, struc="tab"):
         if t0 != self.__t0 or t1 != self.__t1:
             print("Error: t0 ou t1 ne correspond pas au domain de ce diffeomorphime")
         else:
+            # les resultats deja calcules a partir d'autres antecedents ne sont plus valables
+            self.cache_grilles.oublier(("tab_points_reci", "tab_f_points_reci", "tab_df_points_reci",
+                                        "tab_f_df_points_reci", "tab_angles_R", "champ_angles"))
             if struc == "grid":
-                self._tab_points_reci = np.load(path)
+                self._points_reci_charges = (t0, t1, np.load(path))
             else:
                 temp = np.load(path)
                 tab_x, tab_y = [], []
@@ -191,69 +496,120 @@ class DiffeoInfini:
                         ligne_y.append(point[1])
                     tab_x.append(ligne_x)
                     tab_y.append(ligne_y)
-                self._tab_points_reci = np.array([tab_x, tab_y])
+                self._points_reci_charges = (t0, t1, np.array([tab_x, tab_y]))
+            charges = np.ascontiguousarray(self._points_reci_charges[2], dtype=float)
+            self._empreinte_reci = hashlib.sha256(charges.tobytes()).hexdigest()
 
     def tab_points_reci(self, snb=None, multi=10):
+        """
+        Calculer les antecedents des points du plan. Si on n'a pas l'expression du diffeomorphisme reciproque, on les
+        calcule par inverse_newton, et le rapport de convergence est garde dans self.info_inverse
+        :param snb: int
+        :param multi:
+        :return: [x ou y, ligne, colonne]
+        """
         taille = snb or self.snb
-        if self._tab_points_reci is None:
-            if self.__num_reci is None:
-                pass
-            axe_x, axe_y = self.plan(taille)
-            tab_x, tab_y = self.__num_reci(axe_x, axe_y)
-            self._tab_points_reci = (tab_x, tab_y)
+        if self._points_reci_charges is not None:
+            t0, t1, charges = self._points_reci_charges
+            if (t0, t1) == (self.__t0, self.__t1) and taille == len(charges[0]):
+                return charges
 
-        return self._tab_points_reci
+        def calcul():
+            axe_x, axe_y = self.plan(taille)
+            if self.__num_reci is None:
+                tab_x, tab_y, converge, residu = self.inverse_newton(axe_x, axe_y)
+                if not converge.all():
+                    # Newton ne converge pas a partir de l'identite : on repart des antecedents les plus proches
+                    # parmi le plan sur-echantillonne
+                    echec = ~converge
+                    depart_x, depart_y = self.tab_inverse(snb=taille, multi=multi)
+                    tab_x[echec], tab_y[echec], converge[echec], residu[echec] = self.inverse_newton(
+                        axe_x[echec], axe_y[echec], depart=(depart_x[echec], depart_y[echec]))
+                self.info_inverse = {"converge": converge, "residu": residu}
+                if not converge.all():
+                    print("Attention: {} points sur {} n'ont pas converge, residu maximal {}".format(
+                        np.count_nonzero(~converge), converge.size, np.nanmax(residu)))
+                return tab_x, tab_y
+            axe_x, axe_y = self.plan(taille, creux=True)
+            return self.__etendre(self.__evaluer(self.__num_reci, axe_x, axe_y, (taille, taille)), (taille, taille))
+
+        return self.cache_grilles.obtenir(self.__cle("tab_points_reci", taille, multi), calcul)
+
+    def __source_reci(self, taille):
+        """
+        :return: d'ou viennent les antecedents de tab_points_reci pour snb=taille, pour les cles de cache_traces : le
+                 hash des antecedents charges par load_points_reci s'ils servent, sinon "calcules" (par l'expression
+                 reciproque ou par inverse_newton, ce que distingue deja l'empreinte de CacheTraces)
+        """
+        if self._points_reci_charges is not None:
+            t0, t1, charges = self._points_reci_charges
+            if (t0, t1) == (self.__t0, self.__t1) and taille == len(charges[0]):
+                return "charges:" + self._empreinte_reci
+        return "calcules"
 
     def tab_f_points_reci(self, snb=None, multi=10):
         taille = snb or self.snb
-        if self._tab_f_points_reci is None or taille != len(self._tab_f_points_reci[0]):
+        if self.__f_df_num is not None:
+            return self.tab_f_df_points_reci(taille, multi)[0]
+
+        def calcul():
             tab_reci_x, tab_reci_y = self.tab_points_reci(taille, multi)
-            self._tab_f_points_reci = self.__num(tab_reci_x, tab_reci_y)
-        return self._tab_f_points_reci
+            return self.__etendre(self.__evaluer(self.__num, tab_reci_x, tab_reci_y, (taille, taille)),
+                                  (taille, taille))
+
+        return self.cache_grilles.obtenir(self.__cle("tab_f_points_reci", taille, multi), calcul)
 
     def tab_df_points_reci(self, snb=None, multi=10):
         taille = snb or self.snb
-        if self._tab_df_points_reci is None or taille != len(self._tab_df_points_reci[0][0]):
+        if self.__f_df_num is not None:
+            return self.tab_f_df_points_reci(taille, multi)[1]
+
+        def calcul():
             tab_reci_x, tab_reci_y = self.tab_points_reci(taille, multi)
-            self._tab_df_points_reci = self.__df_num(tab_reci_x, tab_reci_y)
-        return self._tab_df_points_reci
+            return Jacobienne(self.__evaluer(self.__df_num, tab_reci_x, tab_reci_y, (taille, taille)), (taille, taille))
+
+        return self.cache_grilles.obtenir(self.__cle("tab_df_points_reci", taille, multi), calcul)
 
-    def tab_angles_R(self, snb=None, multi=10):
+    def tab_f_df_points_reci(self, snb=None, multi=10):
+        """
+        Calculer tab_f_points_reci et tab_df_points_reci en une seule passe (voir f_df), et les garder tous les deux
+        :param snb: int
+        :param multi:
+        :return: (tab_f_points_reci, tab_df_points_reci)
+        """
+        taille = snb or self.snb
+
+        def calcul():
+            tab_reci_x, tab_reci_y = self.tab_points_reci(taille, multi)
+            return self.__tab_f_df(tab_reci_x, tab_reci_y, (taille, taille))
+
+        return self.cache_grilles.obtenir(self.__cle("tab_f_df_points_reci", taille, multi), calcul)
+
+    def tab_angles_R(self, snb=None, multi=10, deroulement="lignes"):
         """
         Calculer les angles des vecteurs dans le champ de vecteur du diffeomorphisme des directions horizontale et
         verticale. Pour chaque point dans l'ensemble arrive, son vecteur horizontal est [∂f1/∂x, ∂f2/∂x], et son angle
         horizontal est (∂f2/∂x / ∂f1/∂x). De meme, son vectuer vertical est [∂f1/∂y, ∂f2/∂y], et son angle vertical
         est (∂f2/∂y / ∂f1/∂y)
+        Les angles donnes par arctan2 sont dans [-pi, pi], on les "deroule" pour qu'ils varient continument : le long
+        de chaque ligne (pour les angles horizontaux) ou de chaque colonne (pour les angles verticaux), deux angles
+        voisins ne different jamais de plus de pi.
         :param snb: int
         :param multi:
+        :param deroulement: "lignes" pour derouler chaque ligne independamment a partir de son premier angle, "2d" pour
+                            derouler d'abord la premiere colonne, puis chaque ligne a partir de celle-ci, de sorte que
+                            les lignes soient coherentes entre elles (pas de saut de 2pi d'une ligne a la suivante)
         :return: [horizontal ou vertical, ligne, colonne]
         """
         taille = snb or self.snb
 
-        def modulo_2pi(x_):
-            """
-            En prenant une valeur reelle x_, retourner y_ tel que y dans [-pi, pi] et x_ mod 2pi = y_
-            :param x_: float
-            :return: float
-            """
-            y_ = x_
-            while y_ > math.pi:
-                y_ -= 2 * math.pi
-            while y_ < -math.pi:
-                y_ += 2 * math.pi
-            return y_
-
         def corrigeur(tab):
-            tab_R = []
-            for ligne in tab:
-                ligne_R = [ligne[0]]
-                for angle in ligne[1:]:
-                    prec = ligne_R[-1]
-                    ligne_R.append(prec + modulo_2pi(angle - prec))
-                tab_R.append(ligne_R)
-            return np.array(tab_R)
-
-        if self._tab_angles_R is None or taille != len(self._tab_angles_R[0]):
+            tab_R = np.unwrap(tab, axis=1)
+            if deroulement == "2d":
+                tab_R += (np.unwrap(tab[:, 0]) - tab[:, 0])[:, np.newaxis]
+            return tab_R
+
+        def calcul():
             tab_df = self.tab_df_points_reci(taille, multi)
             tab_angles_x_2pi = np.arctan2(tab_df[1][0], tab_df[0][0])
             tab_angles_y_2pi = np.arctan2(tab_df[1][1], tab_df[0][1])
@@ -261,186 +617,124 @@ class DiffeoInfini:
             tab_angles_x_R = corrigeur(tab_angles_x_2pi)
             tab_angles_y_R = corrigeur(tab_angles_y_2pi.T) - math.pi / 2
 
-            self._tab_angles_R = np.array([tab_angles_x_R, tab_angles_y_R])
-        return self._tab_angles_R
+            return np.array([tab_angles_x_R, tab_angles_y_R])
 
-    def _distance(self, x_, y_, tab_x_mesh, tab_y_mesh):
-        """
-        Pour chaque point dans l'ensemble donne (tab_x_mesh, tab_y_mesh), calculer la distance euclidienne entre lui et
-        le point (x_,y_)
-        :param x_:
-        :param y_:
-        :param tab_x_mesh:
-        :param tab_y_mesh:
-        :return:
+        return self.cache_grilles.obtenir(self.__cle("tab_angles_R", taille, multi, deroulement), calcul)
+
+    def champ_angles(self, snb=None, multi=10):
         """
-        tempx = tab_x_mesh - x_
-        tempy = tab_y_mesh - y_
-        tab_2d = []
-        for i in range(len(tab_x_mesh)):
-            tab_2d.append(np.sqrt(tempx[i] ** 2 + tempy[i] ** 2))
-        return np.array(tab_2d)
-
-    def _classifier_tab(self, tab_dis, tab_x_mesh, tab_y_mesh, pas, n):
-        """
-        Classier les points dans l'ensemble donne (tab_x_mesh, tab_y_mesh), par leur distance:
-        [0, pas/2) [pas/2, pas + pas/2) [pas + pas/2, 2*pas + pas/2) ... [(n-2)*pas + pas/2, (n-1)*pas + pas/2)
-        (>=(n-1)*pas + pas/2)
-        :param tab_dis: les distances des points dans (tab_x_mesh, tab_y_mesh):
-         tab_2d[i,j]->tab_x_mesh[i,j],tab_y_mesh[i,j]
-        :param tab_x_mesh:
-        :param tab_y_mesh:
-        :param pas: la distance entre deux points adjacents dans une meme ligne de la grille du plan [t0, t1]^2
-        :param n: le nombre des niveaux de classification
-        :return:
+        Retourner l'interpolateur du champ d'angles (voir ChampAngles). Il est construit une seule fois a partir de
+        tab_angles_R, puis garde dans cache_grilles.
+        :param snb: int
+        :param multi:
+        :return: ChampAngles
         """
-        tab_res_x = [[] for i in range(n + 1)]
-        tab_res_y = [[] for i in range(n + 1)]
-        tab_dis_bis = (tab_dis - pas / 2) // pas + 1
-        for i in range(len(tab_dis_bis)):
-            for j in range(len(tab_dis_bis[i])):
-                niveau = int(tab_dis_bis[i, j])
-                if niveau >= n:
-                    tab_res_x[n].append(tab_x_mesh[i, j])
-                    tab_res_y[n].append(tab_y_mesh[i, j])
-                else:
-                    tab_res_x[niveau].append(tab_x_mesh[i, j])
-                    tab_res_y[niveau].append(tab_y_mesh[i, j])
-        return tab_res_x, tab_res_y
-
-    def _classifier_points_cles(self, tab_dis, tab_x_mesh, tab_y_mesh, pas, n):
-        tab_res_x = [[] for i in range(n + 1)]
-        tab_res_y = [[] for i in range(n + 1)]
-        tab_dis_bis = tab_dis // pas + 1
-        for i in range(len(tab_dis_bis)):
-            for j in range(len(tab_dis_bis[i])):
-                niveau = int(tab_dis_bis[i, j])
-                if tab_dis[i, j] >= pas / 2 + niveau * pas:
-                    niveau += 1
-                elif tab_dis[i, j] <= pas / 2 + (niveau - 1) * pas:
-                    niveau -= 1
-                if niveau >= n:
-                    tab_res_x[n].append(tab_x_mesh[i, j])
-                    tab_res_y[n].append(tab_y_mesh[i, j])
-                else:
-                    tab_res_x[niveau].append(tab_x_mesh[i, j])
-                    tab_res_y[niveau].append(tab_y_mesh[i, j])
-        return tab_res_x, tab_res_y
+        taille = snb or self.snb
+        return self.cache_grilles.obtenir(self.__cle("champ_angles", taille, multi, self.deroulement),
+                                          lambda: ChampAngles(self.tab_angles_R(taille, multi, self.deroulement),
+                                                              self.__t0, self.__t1))
 
-    def tab_inverse(self, t0=-1, t1=1, snb=None, multi=10):
+    def tab_inverse(self, t0=None, t1=None, snb=None, multi=10, raffiner=False):
+        """
+        Calculer les antecedents approches des points du plan sans l'expression du diffeomorphisme reciproque : on
+        sur-echantillonne [t0, t1]^2 par (snb * multi)^2 points, on calcule leurs images par f, et pour chaque point du
+        plan on prend le point sur-echantillonne dont l'image est la plus proche. La recherche se fait en une seule
+        requete pour tous les points du plan, grace a un index spatial sur les images (voir GrilleSpatiale).
+        :param t0: valeur minimale dans l'interval I, celle du diffeomorphisme par default
+        :param t1: valeur maximale dans l'interval I, celle du diffeomorphisme par default
+        :param snb: int
+        :param multi: facteur de sur-echantillonnage
+        :param raffiner: si True, on part de ces antecedents approches pour les raffiner par inverse_newton
+        :return: [x ou y, ligne, colonne]
+        """
+        t0 = self.__t0 if t0 is None else t0
+        t1 = self.__t1 if t1 is None else t1
         taille = snb or self.snb
         axe = np.linspace(t0, t1, taille)
-        axe_x, axe_y = np.meshgrid(axe, axe)
+        axe_x, axe_y = np.broadcast_arrays(*np.meshgrid(axe, axe, sparse=True))
         axe2 = np.linspace(t0, t1, taille * multi)
-        axe2_x, axe2_y = np.meshgrid(axe2, axe2)
-        f = self.__num
-        ens_arrive_x, ens_arrive_y = f(axe2_x, axe2_y)
-
-        pas = (t1 - t0) / (taille - 1)
-        n = math.ceil((taille // 2) * math.sqrt(2))
-
-        def ajustement(x_, y_, tab_x_mesh, tab_y_mesh):
-            dis = np.inf
-            test = (pas ** 2) / 4
-            val_x, val_y = None, None
-            tab_x_new, tab_y_new = [], []
-            for i in range(len(tab_x_mesh)):
-                tempx, tempy = [], []
-                for j in range(len(tab_x_mesh[i])):
-                    x_ori, y_ori = tab_x_mesh[i, j], tab_y_mesh[i, j]
-                    fx, fy = f(x_ori, y_ori)
-                    d = (fx - x_) ** 2 + (fy - y_) ** 2
-                    if d < dis:
-                        dis = d
-                        val_x = x_ori
-                        val_y = y_ori
-                    if d >= test:
-                        tempx.append(x_ori)
-                        tempy.append(y_ori)
-                tab_x_new.append(tempx)
-                tab_y_new.append(tempy)
-            return val_x, val_y, tab_x_new, tab_y_new
-
-        tab_dis_cles = ex._distance(-1, -1, axe_x, axe_y)
-        class_x, class_y = ex._classifier_points_cles(tab_dis_cles, axe_x, axe_y, pas, n)
-        tab_dis = ex._distance(-1, -1, ens_arrive_x, ens_arrive_y)
-        tab_inv_x, tab_inv_y = ex._classifier_tab(tab_dis, axe2_x, axe2_y, pas, n)
-        for niveau in range(len(class_x)):
-            for i in range(len(class_x[niveau])):
-                pass
-        pass
-
-        """
-        ens_depart = [(x_, y_) for x_ in np.linspace(t0, t1, taille2) for y_ in np.linspace(t0, t1, taille2)]
-        ens_arrive = [self._num(p[0], p[1]) for p in ens_depart]
-        ens_critere = [[(x_, y_) for x_ in np.linspace(t0, t1, taille)] for y_ in np.linspace(t0, t1, taille)]
-        ens_inverse = []
-        for ligne in ens_critere:
-            ligne_inverse = []
-            for pc in ligne:
-                dif_min = np.inf
-                point_proche = None
-                for i in range(taille2 ** 2):
-                    dif = (ens_arrive[i][0] - pc[0]) ** 2 + (ens_arrive[i][1] - pc[1]) ** 2
-                    if dif < dif_min:
-                        dif_min = dif
-                        point_proche = ens_depart[i]
-                ligne_inverse.append(point_proche)
-            ens_inverse.append(ligne_inverse)
-        return ens_inverse
-        """
-
-    def trace(self, temps=1, snb=None, multi=10, precision=0.005, methode="rk", symetrique=False):
+        ens_arrive = self.__num(*np.meshgrid(axe2, axe2, sparse=True))
+        ens_arrive_x, ens_arrive_y = self.__etendre(ens_arrive, (len(axe2), len(axe2)))
+        indices, distances = GrilleSpatiale(ens_arrive_x, ens_arrive_y).plus_proche(axe_x, axe_y)
+        # indices dans la grille (ligne, colonne) mise a plat
+        tab_inv_x, tab_inv_y = axe2[indices % len(axe2)], axe2[indices // len(axe2)]
+        if raffiner:
+            tab_inv_x, tab_inv_y, converge, residu = self.inverse_newton(axe_x, axe_y, depart=(tab_inv_x, tab_inv_y))
+        return np.array([tab_inv_x, tab_inv_y])
+
+    def trace(self, temps=1, snb=None, multi=10, precision=0.005, methode="rk", symetrique=False, tolerance=1e-5,
+              precedent=None, tolerance_angle=1e-3, points_par_ligne=None):
         """
         A partir les angles en moment temps, tracer l'image du diffeomorphisme dont snb courbes horizontals, snb
         courbes verticals. L'ensemble des angles est de taille snb*multi. precision est le pas de trace. methode en
         choix signifie la methode mathematique utilisee pour tracer l'image. symetrique indique si on beneficie la
         symetrie du diffeomorphisme
+        Apres l'appel, self.info_trace contient le nombre de pas acceptes, de pas rejetes et d'evaluations d'angle.
+        Avec dossier_traces, le resultat est d'abord cherche dans cache_traces (self.info_trace["cache"] est alors
+        True), et sinon il y est sauve. La cle comprend aussi self.deroulement et la source des antecedents (voir
+        load_points_reci). Un resultat obtenu a partir d'un precedent est range sous une autre cle, qui comprend
+        tolerance_angle ; un resultat exact sert aussi quand on donne un precedent. Avec symetrique, precedent est
+        ignore et le resultat est toujours exact.
         :param temps: float dans [0, 1]
         :param snb: int
         :param multi:
-        :param precision:
-        :param methode:
+        :param precision: pas de trace, ou pas initial pour "rk45"
+        :param methode: "rk" (Runge-Kutta d'ordre 4 a pas fixe), "rk45" (Dormand-Prince a pas adaptatif), ou
+                        "euler"
         :param symetrique:
-        :return:
+        :param tolerance: pour "rk45", l'erreur locale toleree sur un pas
+        :param precedent: (temps_precedent, resultat) le resultat de trace pour un autre temps, avec les memes snb,
+                          multi, precision et methode, par ex. l'image precedente d'une animation. On ne retrace alors
+                          que les courbes dont les angles ont change de plus de tolerance_angle, voir __retracer. Si
+                          resultat a lui-meme ete obtenu a partir d'un precedent, on donne
+                          (self.info_trace["origines"], resultat) pour que les erreurs ne s'accumulent pas
+        :param tolerance_angle: en radians, voir precedent
+        :param points_par_ligne: si on le donne, chaque courbe est reechantillonnee par ce nombre de points (voir
+                                 TraceSet.reechantillonner). Le resultat d'un tel appel ne sert pas de precedent
+        :return: [trace_h, trace_v], chacun une liste de [tab_x, tab_y], qu'il soit trace ou lu dans cache_traces ;
+                 deux TraceSet avec points_par_ligne
         """
         taille = snb or self.snb
+        cles = []
+        if self.cache_traces is not None:
+            source_reci = self.__source_reci(taille)
+            cles.append(self.cache_traces.cle(self.__t0, self.__t1, temps, taille, multi, precision, methode, tolerance,
+                                              symetrique, self.deroulement, source_reci))
+            # meme condition que dans __tracer : avec symetrique, le trace est exact malgre precedent
+            if precedent is not None and not symetrique:
+                cles.append(self.cache_traces.cle(self.__t0, self.__t1, temps, taille, multi, precision, methode,
+                                                  tolerance, symetrique, self.deroulement, source_reci,
+                                                  tolerance_angle))
+            for cle in cles:
+                trouve = self.cache_traces.charger(cle)
+                if trouve is not None:
+                    res, origines = trouve
+                    self.info_trace = {"methode": methode, "acceptes": 0, "rejetes": 0, "evaluations": 0,
+                                       "cache": True,
+                                       "origines": origines if origines is not None else np.full(2 * taille, temps)}
+                    return _densifier(res, points_par_ligne)
+        res = self.__tracer(temps, taille, multi, precision, methode, symetrique, tolerance, precedent,
+                            tolerance_angle)
+        if cles:
+            # seul le trace a partir d'un precedent a des origines (le trace symetrique ne remplit pas info_trace)
+            self.cache_traces.sauver(cles[-1], res, self.info_trace["origines"] if len(cles) > 1 else None)
+        return _densifier(res, points_par_ligne)
+
+    def __tracer(self, temps, taille, multi, precision, methode, symetrique, tolerance, precedent, tolerance_angle):
+        """
+        Le calcul de trace, sans cache_traces
+        """
         t0, t1 = self.__t0, self.__t1
-        tab_angles = self.tab_angles_R(taille, multi) * temps
+        if precedent is not None and not symetrique:
+            res, self.info_trace = self.__retracer(temps, precedent, taille, multi, precision, methode, tolerance,
+                                                   tolerance_angle)
+            return res
+        champ = self.champ_angles(taille, multi)
         axe = np.linspace(t0, t1, taille)
         res = []
 
-        def find_sim_points(x_, y_):
-            pas = (t1 - t0) / (taille - 1)
-            kx0 = int((x_ - t0) // pas)
-            if kx0 >= taille:
-                kx0 = taille - 1
-            kx1 = kx0 + 1 if kx0 < taille - 1 else kx0
-            t = (x_ - t0 - kx0 * pas) / pas
-            ky0 = int((y_ - t0) // pas)
-            if ky0 >= taille:
-                ky0 = taille - 1
-            ky1 = ky0 + 1 if ky0 < taille - 1 else ky0
-            s = (y_ - t0 - ky0 * pas) / pas
-            return (kx0, ky0), (kx1, ky0), (kx0, ky1), (kx1, ky1), t, s
-
-        def angle_moyen(direc, p00, p10, p01, p11, t, s):
-            if direc == 'h':
-                a00 = np.array([tab_angles[0, p00[1], p00[0]]])
-                a10 = np.array([tab_angles[0, p10[1], p10[0]]])
-                a01 = np.array([tab_angles[0, p01[1], p01[0]]])
-                a11 = np.array([tab_angles[0, p11[1], p11[0]]])
-            else:
-                a00 = np.array([tab_angles[1, p00[0], p00[1]]])
-                a10 = np.array([tab_angles[1, p10[0], p10[1]]])
-                a01 = np.array([tab_angles[1, p01[0], p01[1]]])
-                a11 = np.array([tab_angles[1, p11[0], p11[1]]])
-            angle = (1 - t) * ((1 - s) * a00 + s * a01) + t * ((1 - s) * a10 + s * a11)
-            return angle
-
         def angle(direc, x_, y_):
-            p00, p10, p01, p11, t, s = find_sim_points(x_, y_)
-            return angle_moyen(direc, p00, p10, p01, p11, t, s)
+            return temps * champ(x_, y_, 0 if direc == 'h' else 1)
 
         def runge_kutta_demi(direc, demi, sens):
             tab = []
@@ -528,70 +822,6 @@ class DiffeoInfini:
                         tab.append([tab_trace_x, tab_trace_y])
             return tab
 
-        def runge_kutta(direc):
-            tab = []
-            if direc == 'h':
-                for y_ in axe:
-                    tab_trace_x, tab_trace_y = [-1.0], [y_]
-                    while tab_trace_x[-1] < t1:
-                        p_n1 = [tab_trace_x[-1], tab_trace_y[-1]]  # 初始点
-                        a1 = angle(direc, p_n1[0], p_n1[1])  # 初始点的斜率
-                        p_n2 = [p_n1[0] + precision / 2 * math.cos(a1),
-                                p_n1[1] + precision / 2 * math.sin(a1)]  # 用a1计算的中点
-                        a2 = angle(direc, p_n2[0], p_n2[1])  # 用a1计算的中点的斜率
-                        p_n3 = [p_n1[0] + precision / 2 * math.cos(a2),
-                                p_n1[1] + precision / 2 * math.sin(a2)]  # 用a2计算的中点
-                        a3 = angle(direc, p_n3[0], p_n3[1])  # 用a2计算的中点的斜率
-                        p_n4 = [p_n1[0] + precision * math.cos(a3),
-                                p_n1[1] + precision * math.sin(a3)]  # 用a3计算的终点
-                        a4 = angle(direc, p_n4[0], p_n4[1])  # 用a3计算的终点斜率
-                        a_m = (a1 + 2 * a2 + 2 * a3 + a4) / 6  # 加权平均斜率
-                        tab_trace_x.append(p_n1[0] + precision * math.cos(a_m))
-                        tab_trace_y.append(p_n1[1] + precision * math.sin(a_m))
-                    tab.append([tab_trace_x, tab_trace_y])
-            else:
-                for x_ in axe:
-                    tab_trace_x, tab_trace_y = [x_], [-1.0]
-                    while tab_trace_y[-1] < t1:
-                        p_n1 = [tab_trace_x[-1], tab_trace_y[-1]]  # 初始点
-                        a1 = angle(direc, p_n1[0], p_n1[1])  # 初始点的斜率
-                        p_n2 = [p_n1[0] - precision / 2 * math.sin(a1),
-                                p_n1[1] + precision / 2 * math.cos(a1)]  # 用a1计算的中点
-                        a2 = angle(direc, p_n2[0], p_n2[1])  # 用a1计算的中点的斜率
-                        p_n3 = [p_n1[0] - precision / 2 * math.sin(a2),
-                                p_n1[1] + precision / 2 * math.cos(a2)]  # 用a2计算的中点
-                        a3 = angle(direc, p_n3[0], p_n3[1])  # 用a2计算的中点的斜率
-                        p_n4 = [p_n1[0] - precision * math.sin(a3),
-                                p_n1[1] + precision * math.cos(a3)]  # 用a3计算的终点
-                        a4 = angle(direc, p_n4[0], p_n4[1])  # 用a3计算的终点斜率
-                        a_m = (a1 + 2 * a2 + 2 * a3 + a4) / 6  # 加权平均斜率
-                        tab_trace_x.append(p_n1[0] - precision * math.sin(a_m))
-                        tab_trace_y.append(p_n1[1] + precision * math.cos(a_m))
-                    tab.append([tab_trace_x, tab_trace_y])
-            return tab
-
-        def euler(direc):
-            tab = []
-            if direc == 'h':
-                for y_ in axe:
-                    tab_trace_hx, tab_trace_hy = [-1.0], [y_]
-                    while tab_trace_hx[-1] < t1:
-                        p00, p10, p01, p11, t, s = find_sim_points(tab_trace_hx[-1], tab_trace_hy[-1])
-                        angle_moy = angle_moyen('h', p00, p10, p01, p11, t, s)
-                        tab_trace_hx.append(tab_trace_hx[-1] + precision * math.cos(angle_moy))
-                        tab_trace_hy.append(tab_trace_hy[-1] + precision * math.sin(angle_moy))
-                    tab.append([tab_trace_hx, tab_trace_hy])
-            else:
-                for x_ in axe:
-                    tab_trace_vx, tab_trace_vy = [x_], [-1.0]
-                    while tab_trace_vy[-1] < t1:
-                        p00, p10, p01, p11, t, s = find_sim_points(tab_trace_vx[-1], tab_trace_vy[-1])
-                        angle_moy = angle_moyen('v', p00, p10, p01, p11, t, s)
-                        tab_trace_vx.append(tab_trace_vx[-1] - precision * math.sin(angle_moy))
-                        tab_trace_vy.append(tab_trace_vy[-1] + precision * math.cos(angle_moy))
-                    tab.append([tab_trace_vx, tab_trace_vy])
-            return tab
-
         def milieux_indx(tab_x, semi):
             milieux = []
             flag = True  # x<semi
@@ -738,30 +968,447 @@ class DiffeoInfini:
                 res.append(tab_h)
                 res.append([])
             else:
-                res.append(runge_kutta('h'))
-                res.append(runge_kutta('v'))
+                images, self.info_trace = self.__trace_lot([temps], taille, multi, precision, methode, tolerance)
+                res = images[0]
         else:
-            res.append(euler('h'))
-            res.append(euler('v'))
+            images, self.info_trace = self.__trace_lot([temps], taille, multi, precision, methode, tolerance)
+            res = images[0]
         return res
 
+    def trace_many(self, temps_array, snb=None, multi=10, precision=0.005, methode="rk", tolerance=1e-5,
+                   images_par_lot=None, points_par_ligne=None):
+        """
+        Tracer les images de plusieurs temps a la fois, par ex. toutes les images d'une animation. Le champ d'angles
+        de l'image de temps t est t fois celui de tab_angles_R : toutes les courbes de toutes les images sont donc
+        integrees dans un seul lot, ou chaque courbe porte le temps de son image. Chaque pas ne coute alors qu'un appel
+        vectorise a l'interpolateur pour toutes les images, au lieu d'un appel par image.
+        Apres l'appel, self.info_trace contient les statistiques cumulees sur toutes les images. Avec dossier_traces,
+        les images deja dans cache_traces ne sont pas retracees (self.info_trace["cache"] est leur nombre), et les
+        autres y sont sauvees.
+        :param temps_array: les temps des images
+        :param snb: int
+        :param multi:
+        :param precision: voir trace
+        :param methode: "rk", "rk45" ou "euler", voir trace
+        :param tolerance: voir trace
+        :param images_par_lot: nombre maximal d'images par lot, pour limiter la memoire ; toutes par default
+        :param points_par_ligne: voir trace
+        :return: une liste de [trace_h, trace_v], comme retourne par trace, par temps de temps_array
+        """
+        taille = snb or self.snb
+        tab_temps = np.atleast_1d(np.asarray(temps_array, dtype=float))
+        images = [None] * len(tab_temps)
+        cles = [None] * len(tab_temps)
+        if self.cache_traces is not None:
+            source_reci = self.__source_reci(taille)
+            for i, temps in enumerate(tab_temps):
+                cles[i] = self.cache_traces.cle(self.__t0, self.__t1, temps, taille, multi, precision, methode,
+                                                tolerance, False, self.deroulement, source_reci)
+                trouve = self.cache_traces.charger(cles[i])
+                if trouve is not None:
+                    images[i] = trouve[0]
+        a_tracer = [i for i, image in enumerate(images) if image is None]
+        pas_lot = images_par_lot or max(len(a_tracer), 1)
+        info = {"methode": methode, "acceptes": 0, "rejetes": 0, "evaluations": 0}
+        for debut in range(0, len(a_tracer), pas_lot):
+            lot = a_tracer[debut:debut + pas_lot]
+            images_lot, info_lot = self.__trace_lot(tab_temps[lot], taille, multi, precision, methode, tolerance)
+            for i, image in zip(lot, images_lot):
+                images[i] = image
+                if cles[i] is not None:
+                    self.cache_traces.sauver(cles[i], image)
+            info["methode"] = info_lot["methode"]
+            for cle in ("acceptes", "rejetes", "evaluations"):
+                info[cle] += info_lot[cle]
+        if self.cache_traces is not None:
+            info["cache"] = len(tab_temps) - len(a_tracer)
+        self.info_trace = info
+        return [_densifier(image, points_par_ligne) for image in images]
+
+    def __trace_lot(self, tab_temps, taille, multi, precision, methode, tolerance):
+        """
+        Tracer dans un seul lot les courbes des images de temps tab_temps. Dans le lot, les courbes de chaque image se
+        suivent : d'abord ses taille courbes horizontales, puis ses taille courbes verticales.
+        :return: (une liste de [trace_h, trace_v] par temps, statistiques comme self.info_trace)
+        """
+        nb_images = len(tab_temps)
+        tab, info = self.__trace_courbes(np.repeat(np.asarray(tab_temps, dtype=float), 2 * taille),
+                                         np.tile(np.arange(2 * taille), nb_images), taille, multi, precision, methode,
+                                         tolerance)
+        images = [[tab[i:i + taille], tab[i + taille:i + 2 * taille]] for i in range(0, len(tab), 2 * taille)]
+        return images, info
+
+    def __trace_courbes(self, temps_courbes, courbes, taille, multi, precision, methode, tolerance):
+        """
+        Tracer dans un seul lot des courbes prises dans des images de temps differents
+        :param temps_courbes: le temps de l'image de chaque courbe
+        :param courbes: le numero de chaque courbe dans son image : d'abord les taille courbes horizontales, puis les
+                        taille courbes verticales
+        :return: (liste des courbes, statistiques comme self.info_trace)
+        """
+        t0, t1 = self.__t0, self.__t1
+        champ = self.champ_angles(taille, multi)
+        axe = np.linspace(t0, t1, taille)
+        depart = np.full(taille, float(t0))
+        courbes = np.asarray(courbes, dtype=int)
+        verticale = courbes >= taille
+        temps_courbes = np.asarray(temps_courbes, dtype=float)
+
+        def angles_lot(tab_x, tab_y, indices):
+            return temps_courbes[indices] * champ(tab_x, tab_y, verticale[indices])
+
+        return self.__integrer(angles_lot, np.concatenate([depart, axe])[courbes],
+                               np.concatenate([axe, depart])[courbes], verticale, precision, methode, tolerance)
+
+    def trace_images(self, temps_list, snb=None, multi=10, precision=0.005, methode="rk", tolerance=1e-5, nb_cles=5,
+                     tolerance_image=0.005, nb_controle=10):
+        """
+        Tracer les images d'une animation en ne tracant exactement que quelques images cles : les images entre deux
+        images cles sont interpolees, courbe par courbe, entre les deux courbes reechantillonnees selon leur longueur
+        d'arc (voir _reechantillonner). Pour estimer l'erreur, on trace exactement, dans l'image du milieu de chaque
+        intervalle entre deux images cles, nb_controle courbes de controle : celles qui bougent le plus entre les deux
+        images cles. L'erreur d'une interpolation lineaire variant comme poids * (1 - poids), on en deduit l'erreur
+        estimee de chaque image de l'intervalle. Tant qu'une image d'un intervalle a une erreur estimee plus grande que
+        tolerance_image, on ajoute l'image du milieu de cet intervalle aux images cles.
+        Les images cles sont tracees en un seul lot par trace_many, et les courbes de controle de tous les intervalles
+        en un seul lot aussi.
+        Apres l'appel, self.info_images contient les indices des images cles ("cles") et l'erreur estimee de chaque
+        image ("erreurs", 0 pour les images cles).
+        :param temps_list: les temps des images, croissants
+        :param nb_cles: nombre d'images cles au depart, reparties regulierement, la premiere et la derniere comprises
+        :param tolerance_image: ecart maximal accepte entre une courbe de controle interpolee et exacte
+        :param nb_controle: nombre de courbes de controle par intervalle
+        Les autres parametres sont ceux de trace
+        :return: une liste de [trace_h, trace_v] par temps, comme retourne par trace
+        """
+        taille = snb or self.snb
+        tab_temps = np.asarray(temps_list, dtype=float)
+        nb = len(tab_temps)
+        cles = set(np.linspace(0, nb - 1, max(min(nb_cles, nb), 2 if nb > 1 else 1)).round().astype(int).tolist())
+        exactes = {}
+        reechantillonnees = {}
+        acceptes = set()
+        erreurs = np.zeros(nb)
+
+        def ligne_de(k, c):
+            # la courbe c de l'image cle k
+            return exactes[k][0][c] if c < taille else exactes[k][1][c - taille]
+
+        def courbe_cle(k, c, nb_points):
+            # la courbe c de l'image cle k, reechantillonnee une seule fois par nombre de points
+            if (k, c, nb_points) not in reechantillonnees:
+                ligne = ligne_de(k, c)
+                reechantillonnees[(k, c, nb_points)] = _reechantillonner(ligne[0], ligne[1], nb_points)
+            return reechantillonnees[(k, c, nb_points)]
+
+        def interpoler(k0, k1, c, poids):
+            nb_points = max(len(ligne_de(k0, c)[0]), len(ligne_de(k1, c)[0]))
+            x0, y0 = courbe_cle(k0, c, nb_points)
+            x1, y1 = courbe_cle(k1, c, nb_points)
+            return [(1 - poids) * x0 + poids * x1, (1 - poids) * y0 + poids * y1]
+
+        def poids_de(i, k0, k1):
+            duree = tab_temps[k1] - tab_temps[k0]
+            return (tab_temps[i] - tab_temps[k0]) / duree if duree != 0 else 0.
+
+        while True:
+            nouvelles = sorted(cles - set(exactes))
+            exactes.update(zip(nouvelles, self.trace_many(tab_temps[nouvelles], taille, multi, precision, methode,
+                                                          tolerance)))
+            ordre = sorted(exactes)
+            # les courbes de controle de toutes les images a verifier, tracees dans un seul lot
+            a_verifier, temps_courbes, courbes = [], [], []
+            for k0, k1 in zip(ordre[:-1], ordre[1:]):
+                if k1 - k0 < 2 or (k0, k1) in acceptes:
+                    continue
+                # on controle les courbes qui bougent le plus entre les deux images cles, ou l'interpolation est la
+                # moins sure
+                deplacement = [np.hypot(*(np.array(interpoler(k0, k1, c, 1.)) - interpoler(k0, k1, c, 0.))).max()
+                               for c in range(2 * taille)]
+                controle = np.argsort(deplacement)[-nb_controle:]
+                milieu = (k0 + k1) // 2
+                a_verifier.append((k0, k1, milieu, controle))
+                temps_courbes.append(np.full(len(controle), tab_temps[milieu]))
+                courbes.append(controle)
+            if not a_verifier:
+                break
+            tab_controle, _ = self.__trace_courbes(np.concatenate(temps_courbes), np.concatenate(courbes), taille,
+                                                   multi, precision, methode, tolerance)
+            a_raffiner = set()
+            tab_controle = iter(tab_controle)
+            for k0, k1, milieu, controle in a_verifier:
+                poids = poids_de(milieu, k0, k1)
+                erreur = 0.
+                for c in controle:
+                    ex_x, ex_y = next(tab_controle)
+                    x_, y_ = interpoler(k0, k1, c, poids)
+                    ex_x, ex_y = _reechantillonner(ex_x, ex_y, len(x_))
+                    erreur = max(erreur, np.hypot(x_ - ex_x, y_ - ex_y).max())
+                # l'erreur d'une interpolation lineaire varie comme poids * (1 - poids) le long de l'intervalle
+                interieur = np.arange(k0 + 1, k1)
+                tab_poids = np.array([poids_de(i, k0, k1) for i in interieur])
+                erreurs[interieur] = erreur * tab_poids * (1 - tab_poids) / max(poids * (1 - poids), 1e-12)
+                if erreurs[interieur].max() > tolerance_image:
+                    a_raffiner.add((k0 + k1) // 2)
+                else:
+                    acceptes.add((k0, k1))
+            if not a_raffiner:
+                break
+            cles |= a_raffiner
+        ordre = sorted(exactes)
+        erreurs[ordre] = 0.
+        images = []
+        for i in range(nb):
+            if i in exactes:
+                images.append(exactes[i])
+                continue
+            k = np.searchsorted(ordre, i)
+            k0, k1 = ordre[k - 1], ordre[k]
+            lignes = [interpoler(k0, k1, c, poids_de(i, k0, k1)) for c in range(2 * taille)]
+            images.append([lignes[:taille], lignes[taille:]])
+        self.info_images = {"cles": sorted(exactes), "erreurs": erreurs}
+        return images
+
+    def __integrer(self, angles_lot, depart_x, depart_y, verticale, precision, methode, tolerance):
+        """
+        Tracer un lot de courbes par la methode donnee (voir trace)
+        :return: (liste des courbes, statistiques comme self.info_trace)
+        """
+        t1 = self.__t1
+        if methode == "rk45":
+            return self._dormand_prince_lot(angles_lot, depart_x, depart_y, verticale, t1, precision, tolerance)
+        if methode == "rk":
+            tab = self._runge_kutta_lot(angles_lot, depart_x, depart_y, verticale, t1, precision)
+            nb_pas = sum(len(ligne[0]) - 1 for ligne in tab)
+            return tab, {"methode": methode, "acceptes": nb_pas, "rejetes": 0, "evaluations": 4 * nb_pas}
+        tab = self._euler_lot(angles_lot, depart_x, depart_y, verticale, t1, precision)
+        nb_pas = sum(len(ligne[0]) - 1 for ligne in tab)
+        return tab, {"methode": "euler", "acceptes": nb_pas, "rejetes": 0, "evaluations": nb_pas}
+
+    def __retracer(self, temps, precedent, taille, multi, precision, methode, tolerance, tolerance_angle):
+        """
+        Tracer l'image de temps a partir de celle d'un autre temps. Le champ d'angles de temps est temps fois celui de
+        tab_angles_R, donc en chaque point deja trace l'angle change de (temps - temps_precedent) * champ. Pour chaque
+        courbe, on cherche le premier point ou ce changement depasse tolerance_angle : avant ce point, la courbe est
+        recopiee ; a partir du point qui le precede, elle est retracee. Une courbe qui ne change nulle part (loin du
+        centre de la deformation, ou les angles sont presque nuls) est recopiee en entier. Toutes les courbes a
+        retracer le sont dans un seul lot, donc le temps de calcul suit la part de l'image qui bouge vraiment.
+        Le debut recopie d'une courbe a ete trace pour un temps plus ancien, son origine : on compare toujours a
+        l'origine de chaque courbe, et non a l'image precedente, sinon les petits changements toleres d'une image a
+        l'autre s'additionneraient au fil d'une animation.
+        :param precedent: (temps_precedent, resultat), temps_precedent etant un float ou l'origine de chaque courbe
+        :return: ([trace_h, trace_v], statistiques comme self.info_trace, avec en plus "recopiees" et "retracees",
+                 les nombres de courbes recopiees en entier et retracees au moins en partie, et "origines")
+        """
+        temps_precedent, (trace_h, trace_v) = precedent
+        lignes = [(np.asarray(ligne[0], dtype=float), np.asarray(ligne[1], dtype=float))
+                  for ligne in list(trace_h) + list(trace_v)]
+        origines = np.array(np.broadcast_to(np.asarray(temps_precedent, dtype=float), (len(lignes),)))
+        champ = self.champ_angles(taille, multi)
+        longueurs = np.array([len(ligne[0]) for ligne in lignes])
+        debuts = np.concatenate([[0], np.cumsum(longueurs)[:-1]])
+        verticale = np.arange(len(lignes)) >= len(trace_h)
+        # tous les points deja traces en un seul appel a l'interpolateur
+        tab_x = np.concatenate([ligne[0] for ligne in lignes])
+        tab_y = np.concatenate([ligne[1] for ligne in lignes])
+        change = np.abs(np.repeat(temps - origines, longueurs) * champ(tab_x, tab_y, np.repeat(verticale, longueurs)))
+        position = np.arange(len(tab_x)) - np.repeat(debuts, longueurs)
+        premier = np.minimum.reduceat(np.where(change > tolerance_angle, position, len(tab_x)), debuts)
+        a_retracer = np.nonzero(premier < longueurs)[0]
+        reprise = np.maximum(premier[a_retracer] - 1, 0)
+        resultat = list(lignes)
+        info = {"methode": methode, "acceptes": 0, "rejetes": 0, "evaluations": 0}
+        if len(a_retracer) > 0:
+            verticale_lot = verticale[a_retracer]
+
+            def angles_lot(x_, y_, indices):
+                return temps * champ(x_, y_, verticale_lot[indices])
+
+            depart_x = np.array([lignes[i][0][k] for i, k in zip(a_retracer, reprise)])
+            depart_y = np.array([lignes[i][1][k] for i, k in zip(a_retracer, reprise)])
+            tab, info = self.__integrer(angles_lot, depart_x, depart_y, verticale_lot, precision, methode, tolerance)
+            for i, k, (suite_x, suite_y) in zip(a_retracer, reprise, tab):
+                resultat[i] = (np.concatenate([lignes[i][0][:k], suite_x]),
+                               np.concatenate([lignes[i][1][:k], suite_y]))
+            # une courbe retracee depuis son debut n'a plus rien de l'ancienne
+            origines[a_retracer[reprise == 0]] = temps
+        info["recopiees"] = len(lignes) - len(a_retracer)
+        info["retracees"] = len(a_retracer)
+        info["origines"] = origines
+        resultat = [[ligne_x, ligne_y] for ligne_x, ligne_y in resultat]
+        return [resultat[:len(trace_h)], resultat[len(trace_h):]], info
+
+    @staticmethod
+    def _runge_kutta_lot(angle, depart_x, depart_y, verticale, t1, precision, nb_max=None):
+        """
+        Tracer toutes les courbes en meme temps par la methode de Runge-Kutta d'ordre 4. L'etat de toutes les courbes
+        est garde dans deux tableaux numpy, et seules les courbes pas encore finies (les indices actifs) avancent d'un
+        pas a chaque iteration, au lieu de tracer les courbes une par une.
+        Une courbe horizontale avance selon (cos(a), sin(a)) et finit quand x >= t1, une courbe verticale avance selon
+        (-sin(a), cos(a)) et finit quand y >= t1. On peut donc melanger les deux familles dans un meme lot.
+        :param angle: fonction (tab_x, tab_y, indices) -> tab_angles, vectorisee. indices sont les numeros des courbes
+                      correspondant aux points, pour que angle puisse choisir le champ (horizontal ou vertical)
+        :param depart_x: abscisses des points de depart, une par courbe
+        :param depart_y: ordonnees des points de depart, une par courbe
+        :param verticale: tableau de booleens, True si la courbe est verticale
+        :param t1: borne a atteindre
+        :param precision: pas de trace
+        :param nb_max: nombre maximal de pas, pour ne pas boucler indefiniment sur une courbe qui ne sort pas
+        :return: [[tab_trace_x, tab_trace_y], ...], une courbe par point de depart, dans le meme ordre. Les points
+                 sont ranges au fur et a mesure dans un _Historique, dimensionne d'avance par le nombre de pas prevu
+        """
+        px = np.array(depart_x, dtype=float)
+        py = np.array(depart_y, dtype=float)
+        verticale = np.asarray(verticale, dtype=bool)
+        decalage = np.where(verticale, math.pi / 2, 0.)
+        if nb_max is None:
+            nb_max = int(100 * (t1 - min(px.min(), py.min(), t1 - 1)) / precision) + 1
+        historique = _Historique(px, py, _nb_points_prevu(px, py, verticale, t1, precision))
+        actif = np.nonzero(np.where(verticale, py, px) < t1)[0]
+        demi = precision / 2
+        for pas in range(1, nb_max + 1):
+            if len(actif) == 0:
+                break
+            x_, y_, d_ = px[actif], py[actif], decalage[actif]
+            a1 = angle(x_, y_, actif) + d_
+            a2 = angle(x_ + demi * np.cos(a1), y_ + demi * np.sin(a1), actif) + d_
+            a3 = angle(x_ + demi * np.cos(a2), y_ + demi * np.sin(a2), actif) + d_
+            a4 = angle(x_ + precision * np.cos(a3), y_ + precision * np.sin(a3), actif) + d_
+            a_m = (a1 + 2 * a2 + 2 * a3 + a4) / 6
+            x_ += precision * np.cos(a_m)
+            y_ += precision * np.sin(a_m)
+            px[actif], py[actif] = x_, y_
+            historique.ajouter(actif, x_, y_, pas)
+            actif = actif[np.where(verticale[actif], y_, x_) < t1]
+        return historique.courbes()
+
+    @staticmethod
+    def _euler_lot(angle, depart_x, depart_y, verticale, t1, precision, nb_max=None):
+        """
+        Meme chose que _runge_kutta_lot, mais par la methode d'Euler : une seule evaluation d'angle par pas
+        :return: [[tab_trace_x, tab_trace_y], ...], une courbe par point de depart, dans le meme ordre
+        """
+        px = np.array(depart_x, dtype=float)
+        py = np.array(depart_y, dtype=float)
+        verticale = np.asarray(verticale, dtype=bool)
+        decalage = np.where(verticale, math.pi / 2, 0.)
+        if nb_max is None:
+            nb_max = int(100 * (t1 - min(px.min(), py.min(), t1 - 1)) / precision) + 1
+        historique = _Historique(px, py, _nb_points_prevu(px, py, verticale, t1, precision))
+        actif = np.nonzero(np.where(verticale, py, px) < t1)[0]
+        for pas in range(1, nb_max + 1):
+            if len(actif) == 0:
+                break
+            x_, y_ = px[actif], py[actif]
+            a_ = angle(x_, y_, actif) + decalage[actif]
+            x_ += precision * np.cos(a_)
+            y_ += precision * np.sin(a_)
+            px[actif], py[actif] = x_, y_
+            historique.ajouter(actif, x_, y_, pas)
+            actif = actif[np.where(verticale[actif], y_, x_) < t1]
+        return historique.courbes()
+
+    @staticmethod
+    def _dormand_prince_lot(angle, depart_x, depart_y, verticale, t1, precision, tolerance, pas_max=None,
+                            nb_max=None):
+        """
+        Meme chose que _runge_kutta_lot, mais par la methode de Dormand-Prince (Runge-Kutta 5(4) emboitee) a pas
+        adaptatif : chaque courbe a son propre pas, qui diminue quand l'erreur locale estimee depasse tolerance (le pas
+        est alors rejete et recommence) et augmente dans les regions ou le champ d'angles est plat.
+        La courbe est parametree par sa longueur d'arc : (x, y)' = (cos(a), sin(a)) pour une courbe horizontale.
+        :param angle: fonction (tab_x, tab_y, indices) -> tab_angles, vectorisee
+        :param depart_x: abscisses des points de depart, une par courbe
+        :param depart_y: ordonnees des points de depart, une par courbe
+        :param verticale: tableau de booleens, True si la courbe est verticale
+        :param t1: borne a atteindre
+        :param precision: pas initial
+        :param tolerance: erreur locale toleree sur un pas
+        :param pas_max: pas maximal, pour que les courbes restent assez fines a dessiner (10 * precision par default)
+        :param nb_max: nombre maximal d'iterations
+        :return: ([[tab_trace_x, tab_trace_y], ...], {"acceptes", "rejetes", "evaluations"})
+        """
+        # tableau de Butcher de Dormand-Prince, la derniere etape est evaluee au nouveau point (FSAL)
+        tab_a = [[],
+                 [1 / 5],
+                 [3 / 40, 9 / 40],
+                 [44 / 45, -56 / 15, 32 / 9],
+                 [19372 / 6561, -25360 / 2187, 64448 / 6561, -212 / 729],
+                 [9017 / 3168, -355 / 33, 46732 / 5247, 49 / 176, -5103 / 18656],
+                 [35 / 384, 0, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84]]
+        tab_e = [71 / 57600, 0, -71 / 16695, 71 / 1920, -17253 / 339200, 22 / 525, -1 / 40]
+        pas_max = pas_max or 10 * precision
+        pas_min = precision / 100
+        px = np.array(depart_x, dtype=float)
+        py = np.array(depart_y, dtype=float)
+        verticale = np.asarray(verticale, dtype=bool)
+        decalage = np.where(verticale, math.pi / 2, 0.)
+        if nb_max is None:
+            nb_max = int(100 * (t1 - min(px.min(), py.min(), t1 - 1)) / pas_min) + 1
+        tab_h = np.full(len(px), float(precision))
+        a_depart = angle(px, py, np.arange(len(px))) + decalage
+        k1_x, k1_y = np.cos(a_depart), np.sin(a_depart)
+        info = {"methode": "rk45", "acceptes": 0, "rejetes": 0, "evaluations": len(px)}
+        # les pas grandissent vite dans les regions ou le champ est plat : on prevoit au pas maximal, et l'historique
+        # grandit si besoin
+        historique = _Historique(px, py, _nb_points_prevu(px, py, verticale, t1, pas_max))
+        actif = np.nonzero(np.where(verticale, py, px) < t1)[0]
+        for _ in range(nb_max):
+            if len(actif) == 0:
+                break
+            x_, y_, d_ = px[actif], py[actif], decalage[actif]
+            # comme |(x, y)'| = 1, un pas plus court que la distance a t1 ne depasse pas t1 : on ne depasse la borne
+            # que d'au plus precision, comme a pas fixe
+            reste = t1 - np.where(verticale[actif], y_, x_)
+            h = np.minimum(tab_h[actif], np.maximum(reste, precision))
+            tab_kx, tab_ky = [k1_x[actif]], [k1_y[actif]]
+            for coefs in tab_a[1:]:
+                sx = x_ + h * sum(c * k for c, k in zip(coefs, tab_kx) if c != 0)
+                sy = y_ + h * sum(c * k for c, k in zip(coefs, tab_ky) if c != 0)
+                a_ = angle(sx, sy, actif) + d_
+                tab_kx.append(np.cos(a_))
+                tab_ky.append(np.sin(a_))
+            # sx, sy est la solution d'ordre 5, et on estime l'erreur par la difference avec celle d'ordre 4
+            err_x = h * sum(e * k for e, k in zip(tab_e, tab_kx) if e != 0)
+            err_y = h * sum(e * k for e, k in zip(tab_e, tab_ky) if e != 0)
+            err = np.maximum(np.sqrt(err_x ** 2 + err_y ** 2), 1e-16)
+            accepte = (err <= tolerance) | (h <= pas_min)
+            facteur = np.clip(0.9 * (tolerance / err) ** 0.2, 0.2, 5.)
+            tab_h[actif] = np.clip(h * facteur, pas_min, pas_max)
+            ind = actif[accepte]
+            px[ind], py[ind] = sx[accepte], sy[accepte]
+            k1_x[ind], k1_y[ind] = tab_kx[-1][accepte], tab_ky[-1][accepte]
+            historique.ajouter(ind, sx[accepte], sy[accepte])
+            info["evaluations"] += 6 * len(actif)
+            info["acceptes"] += len(ind)
+            info["rejetes"] += len(actif) - len(ind)
+            actif = actif[np.where(verticale[actif], py[actif], px[actif]) < t1]
+        return historique.courbes(), info
+
     def corriger(self, tab_trace, expr=None, symbol=None):
+        """
+        Corriger la fin des courbes horizontales. tab_trace n'est pas modifie : les courbes corrigees sont des copies,
+        ce qui permet de garder tab_trace comme precedent d'un autre trace (voir trace), ou de corriger un trace en
+        lecture seule (par ex. charge par TraceSet.charger_npz avec mmap)
+        :return: [trace_h corrige, trace_v]
+        """
         sym = symbol if symbol is not None else sp.Symbol('x')
         cor_sym = expr if expr is not None else (1 / 2 * (1 - sp.exp(-sym)))
         cor = sp.lambdify(sym, cor_sym, "numpy")
         tab_cor_h, tab_cor_v = tab_trace
+        lignes = []
         for ligne in tab_cor_h:
-            tab_x, tab_y = ligne
+            tab_x = np.asarray(ligne[0], dtype=float)
+            tab_y = np.array(ligne[1], dtype=float)
             i = 0
             while tab_x[i] < 0.8 * self.__t1:
                 i += 1
-            for j in range(i, len(tab_x)):
-                tab_y[j] = cor(tab_x[i]) * tab_y[j]
-        return [tab_cor_h, tab_cor_v]
+            tab_y[i:] *= cor(tab_x[i])
+            lignes.append([tab_x, tab_y])
+        return [lignes, tab_cor_v]
 
     """Affichage"""
 
-    def draw(self, direction='a', snb=None, mode="direct", display=True):
+    def draw(self, direction='a', snb=None, mode="direct", display=True, styles=None):
         """
         Afficher le diffeomorphisme par une image en 2D
         :param direction: soit 'h' pour la direction horientale, soit 'v' pour la direction verticale, soit l'autre pour
@@ -769,20 +1416,22 @@ class DiffeoInfini:
         :param snb:
         :param mode:
         :param display:
+        :param styles: {'h': dict, 'v': dict} les options de LineCollection de chaque famille, voir dessiner_courbes
         :return:
         """
         taille = snb or self.snb
         tab_x, tab_y = self.tab_f(taille) if mode == "direct" else self.tab_f_points_reci(taille)
+        # chaque ligne de tab_x, tab_y est une courbe horizontale, chaque colonne une courbe verticale
+        familles = {'h': np.stack([tab_x, tab_y], axis=-1), 'v': np.stack([tab_x.T, tab_y.T], axis=-1)}
         if direction == 'h':
             plt.title("Diffeomorphisme dans la direction horientale")
-            plt.plot(tab_x.T, tab_y.T)
         elif direction == 'v':
             plt.title("Diffeomorphisme dans la direction verticale")
-            plt.plot(tab_x, tab_y)
         else:
             plt.title("Diffeomorphisme")
-            plt.plot(tab_x.T, tab_y.T)
-            plt.plot(tab_x, tab_y)
+        if direction in ('h', 'v'):
+            familles = {direction: familles[direction]}
+        dessiner_courbes(familles, styles=styles)
         if display:
             plt.show()
 
@@ -855,7 +1504,7 @@ class DiffeoInfini:
             ind = taille // 2
         v_min, v_max = val_min, val_max
         tick = 0.25 * math.pi
-        tab = ex.tab_angles_R(taille)[case][ind]
+        tab = self.tab_angles_R(taille)[case][ind]
         if v_min is None:
             v_min = (min(tab) // tick - 1) * tick
         if v_max is None:
@@ -865,46 +1514,73 @@ class DiffeoInfini:
         my_y_ticks = np.arange(v_min, v_max, tick)
         plt.yticks(my_y_ticks)
         plt.xlabel("x")
-        plt.ylabel('$\Theta$')
+        plt.ylabel(r'$\Theta$')
         res = plt.plot(axe, tab)
         if display:
             plt.show()
         return res
 
     def play_angles(self, direction, snb=None, bsave=True, save_name=None):
+        """
+        Animer les angles de chaque ligne (ou colonne) de tab_angles_R, l'une apres l'autre. La courbe et le titre
+        sont crees une seule fois, puis seules leurs donnees changent d'une image a l'autre (avec blit)
+        """
         taille = snb or self.snb
         fig = plt.figure()
         if direction == 'h':
             case = 0
+            direction_str = "ligne"
         else:
             case = 1
+            direction_str = "colonne"
         tab = np.array(self.tab_angles_R(taille)[case])
         tick = 0.25 * math.pi
         val_min = (tab.min() // tick - 1) * tick
         val_max = (tab.max() // tick + 2) * tick
-        tab_fig = []
-        for i in range(taille):
-            tab_fig.append(self.draw_angles_ligne(direction, taille, i, val_min, val_max, False))
-        im_ani = anime.ArtistAnimation(fig, tab_fig, interval=50, repeat_delay=3000, blit=True)
+        axe = np.linspace(self.__t0, self.__t1, taille)
+        ax = fig.gca()
+        ax.set_xlim(self.__t0, self.__t1)
+        ax.set_ylim(val_min, val_max)
+        ax.set_yticks(np.arange(val_min, val_max, tick))
+        ax.set_xlabel("x")
+        ax.set_ylabel(r'$\Theta$')
+        courbe, = ax.plot(axe, tab[0], animated=True)
+        # le titre de la figure n'est pas redessine par blit, on ecrit donc le titre dans les axes
+        titre = ax.text(0.5, 1.02, "", transform=ax.transAxes, ha="center", animated=True)
+
+        def image(i):
+            courbe.set_ydata(tab[i])
+            titre.set_text("Angles de la ${}-ieme$ {} sur {} en total".format(i, direction_str, taille))
+            return courbe, titre
+
+        im_ani = anime.FuncAnimation(fig, image, frames=taille, interval=50, repeat_delay=3000, blit=True)
         if bsave:
             name = save_name
             if name is None:
                 name = "animation"
-            im_ani.save(name + ".html")
+            im_ani.save(name + ".html", writer="html")
         return im_ani
 
     def draw_trace(self, temps, direction='a', snb=None, multi=10, display=True, bcorrige=True, bsave=False,
-                   save_name=None, methode="rk", symetric=False):
+                   save_name=None, methode="rk", symetric=False, resultat=None, styles=None):
+        """
+        :param resultat: [trace_h, trace_v] deja calcule (par ex. une image de trace_images) a dessiner a la place de
+                         trace(temps)
+        :param styles: {'h': dict, 'v': dict} les options de LineCollection de chaque famille, voir dessiner_courbes
+        """
         taille = snb or self.snb
-        trace_h, trace_v = self.trace(temps, taille, multi, methode=methode, symetrique=symetric)
+        if resultat is not None:
+            trace_h, trace_v = resultat
+        else:
+            trace_h, trace_v = self.trace(temps, taille, multi, methode=methode, symetrique=symetric)
         if bcorrige:
             trace_h, trace_v = self.corriger([trace_h, trace_v])
+        familles = {}
         if direction == 'h' or direction == 'a':
-            for ligne in trace_h:
-                plt.plot(ligne[0], ligne[1])
+            familles['h'] = trace_h
         if direction == 'v' or direction == 'a':
-            for ligne in trace_v:
-                plt.plot(ligne[0], ligne[1])
+            familles['v'] = trace_v
+        dessiner_courbes(familles, styles=styles)
         if bsave:
             name = save_name
             if name is None:
@@ -914,27 +1590,225 @@ class DiffeoInfini:
         if display:
             plt.show()
 
-    def play(self, nb_frame, direction='a', snb=None, bsave=True, save_name=None):
+    def render_frames(self, temps_list, out_dir, workers=None, direction='a', snb=None, multi=10, bcorrige=False,
+                      methode="rk", symetric=False, prefixe="frame"):
+        """
+        Dessiner et sauver une image par draw_trace pour chaque temps de temps_list, en repartissant les images entre
+        workers processus. Le champ d'angles est calcule une seule fois ici, mis en memoire partagee (voir
+        partager_grilles), et le diffeomorphisme n'est envoye qu'une fois a chaque processus.
+        L'image du i-eme temps s'appelle toujours prefixe_i.png (i sur 4 chiffres) ; on peut donc reprendre un rendu
+        interrompu : les images qui existent deja ne sont pas refaites. Chaque image est d'abord ecrite sous un nom
+        temporaire, puis renommee, pour qu'une image a moitie ecrite ne soit jamais prise pour une image finie.
+        :param temps_list: les temps des images
+        :param out_dir: le dossier des images, cree s'il n'existe pas
+        :param workers: nombre de processus, os.cpu_count() par default ; 1 pour tout dessiner dans ce processus
+        :param prefixe: le debut du nom des images
+        Les autres parametres sont ceux de draw_trace
+        :return: la liste des chemins des images, dans l'ordre de temps_list
+        """
+        taille = snb or self.snb
+        os.makedirs(out_dir, exist_ok=True)
+        chemins = [os.path.join(out_dir, "{}_{:04d}.png".format(prefixe, i)) for i in range(len(temps_list))]
+        a_faire = [(temps, chemin) for temps, chemin in zip(temps_list, chemins) if not os.path.exists(chemin)]
+        if not a_faire:
+            return chemins
+        options = {"direction": direction, "snb": taille, "multi": multi, "bcorrige": bcorrige, "methode": methode,
+                   "symetric": symetric}
+        self.champ_angles(taille, multi)
+        workers = min(workers or os.cpu_count() or 1, len(a_faire))
+        if workers == 1:
+            # sans passer par _diffeo_rendu, qui garderait self (et ses grilles) apres l'appel
+            for temps, chemin in a_faire:
+                _rendre_image(temps, chemin, options, self)
+            return chemins
+        self.partager_grilles()
+        with multiprocessing.Pool(workers, initializer=_initialiser_rendu, initargs=(self,)) as pool:
+            pool.starmap(_rendre_image, [(temps, chemin, options) for temps, chemin in a_faire])
+        return chemins
+
+    def play(self, nb_frame, direction='a', snb=None, bsave=True, save_name=None, nb_cles=None, tolerance_image=0.005,
+             tolerance_angle=1e-3, bcorrige=True):
+        """
+        Animer le trace du diffeomorphisme pour nb_frame temps de 0 a 1. Chaque famille de courbes est une seule
+        LineCollection, creee une seule fois : d'une image a l'autre, on ne change que ses segments, et seuls les axes
+        sont redessines (blit). Les images sont calculees a la demande par un generateur, chacune a partir de la
+        precedente (voir le parametre precedent de trace) : la memoire ne depend pas du nombre d'images.
+        :param nb_cles: si on le donne, seules quelques images cles sont tracees exactement, les autres sont
+                        interpolees, voir trace_images. Toutes les images sont alors calculees d'avance
+        :param tolerance_image: voir trace_images
+        :param tolerance_angle: voir trace
+        :param bcorrige: voir draw_trace. Chaque image est corrigee pour l'affichage seulement : l'image suivante est
+                         tracee a partir du resultat non corrige
+        """
         taille = snb or self.snb
         fig = plt.figure()
-        tab_fig = []
-        for i in range(0, 1, nb_frame):
-            plt.clf()
-            self.draw_trace(i, direction, taille, display=False)
-            tab_fig.append(plt.gcf())
-        im_ani = anime.ArtistAnimation(fig, tab_fig, interval=50, repeat_delay=3000, blit=True)
+        ax = fig.gca()
+        marge = 0.1 * (self.__t1 - self.__t0)
+        ax.set_xlim(self.__t0 - marge, self.__t1 + marge)
+        ax.set_ylim(self.__t0 - marge, self.__t1 + marge)
+        tab_temps = np.linspace(0, 1, nb_frame)
+        familles = [i for i, d in enumerate(('h', 'v')) if direction in (d, 'a')]
+        collections = []
+        for _ in familles:
+            collection = collection_courbes([], {"animated": True})
+            ax.add_collection(collection)
+            collections.append(collection)
+
+        def images():
+            if nb_cles is None:
+                yield from self.__traces(tab_temps, taille, 10, bcorrige, tolerance_angle)
+                return
+            for resultat in self.trace_images(tab_temps, taille, nb_cles=nb_cles, tolerance_image=tolerance_image):
+                yield self.corriger(resultat) if bcorrige else resultat
+
+        def image(resultat):
+            for collection, famille in zip(collections, familles):
+                collection.set_segments(_segments(resultat[famille]))
+            return collections
+
+        def vider():
+            # sans init_func, FuncAnimation dessine une premiere fois la premiere image, qu'il faudrait tracer en plus
+            for collection in collections:
+                collection.set_segments([])
+            return collections
+
+        im_ani = anime.FuncAnimation(fig, image, frames=images, init_func=vider, interval=50, repeat_delay=3000,
+                                     blit=True, save_count=nb_frame, cache_frame_data=False)
         if bsave:
             name = save_name
             if name is None:
                 name = "animation"
-            im_ani.save(name + ".html")
+            im_ani.save(name + ".html", writer="html")
         return im_ani
 
+    def raster_frames(self, temps_list, canevas=None, direction='a', snb=None, multi=10, bcorrige=False,
+                      styles=None, tolerance_angle=1e-3):
+        """
+        Tracer les images de temps_list et les dessiner une a une dans canevas, sans matplotlib. Comme dans play,
+        chaque image est tracee a partir de la precedente (voir le parametre precedent de trace).
+        Exemple, pour ecrire les images brutes dans un fichier :
+            for canevas in diffeo.raster_frames(tab_temps):
+                canevas.ecrire(fichier)
+        :param canevas: Canevas ou dessiner, par default un Canevas 1920x1080 sur le carre [t0, t1]^2 avec une marge
+        :param styles: voir Canevas.tracer_trace
+        Les autres parametres sont ceux de draw_trace et de trace
+        :return: generateur qui donne canevas apres chaque image ; c'est toujours le meme canevas, dont l'image est
+                 effacee a l'image suivante (copier canevas.image pour la garder)
+        """
+        canevas = canevas or self.__canevas()
+        for resultat in self.__traces(temps_list, snb or self.snb, multi, bcorrige, tolerance_angle):
+            canevas.effacer()
+            canevas.tracer_trace(resultat, direction, styles)
+            yield canevas
+
+    def __canevas(self):
+        marge = 0.1 * (self.__t1 - self.__t0)
+        return Canevas(limites=(self.__t0 - marge, self.__t1 + marge) * 2)
+
+    def __traces(self, temps_list, taille, multi, bcorrige, tolerance_angle):
+        """
+        :return: generateur des traces des temps de temps_list, chacun trace a partir du precedent
+        """
+        precedent = None
+        for temps in temps_list:
+            resultat = self.trace(temps, taille, multi, precedent=precedent, tolerance_angle=tolerance_angle)
+            precedent = (temps if precedent is None else self.info_trace["origines"], resultat)
+            if bcorrige:
+                resultat = self.corriger(resultat)
+            yield resultat
+
+    def render_pipeline(self, temps_list, nom=None, out_dir=None, canevas=None, images_par_seconde=20,
+                        direction='a', snb=None, multi=10, bcorrige=False, styles=None, taille_file=4,
+                        prefixe="frame", tolerance_angle=1e-3):
+        """
+        Comme save_video (ou render_frames avec out_dir), mais les trois etages "trace", "rasteriser" et "ecrire"
+        tournent chacun dans un thread, relies par des files d'au plus taille_file images (voir Pipeline) : l'ecriture
+        sur le disque et la compression des PNG se font pendant le trace des images suivantes.
+        Apres l'appel, self.info_pipeline contient les statistiques de chaque etage, voir Pipeline.stats
+        :param nom: le fichier video, voir FluxVideo
+        :param out_dir: ou bien le dossier des images PNG prefixe_i.png (i sur 4 chiffres), cree s'il n'existe pas.
+                        Comme dans render_frames, les images qui existent deja ne sont pas refaites
+        Les autres parametres sont ceux de raster_frames et de save_video
+        :return: nom, ou la liste des chemins des images
+        """
+        canevas = canevas or self.__canevas()
+        flux, chemins, a_faire = None, None, None
+        if out_dir is None:
+            flux = FluxVideo(nom, canevas.largeur, canevas.hauteur, images_par_seconde)
+        else:
+            os.makedirs(out_dir, exist_ok=True)
+            chemins = [os.path.join(out_dir, "{}_{:04d}.png".format(prefixe, i)) for i in range(len(temps_list))]
+            a_faire = [i for i, chemin in enumerate(chemins) if not os.path.exists(chemin)]
+            temps_list = [temps_list[i] for i in a_faire]
+
+        def rasteriser(resultat):
+            canevas.effacer()
+            canevas.tracer_trace(resultat, direction, styles)
+            # le canevas resert a l'image suivante pendant que celle-ci attend d'etre ecrite
+            return canevas.image.copy()
+
+        numeros = iter(a_faire or [])
+
+        def ecrire(image):
+            if flux is not None:
+                flux.ajouter(image)
+                return
+            # nom temporaire puis renommage, comme dans _rendre_image
+            dossier, nom_image = os.path.split(chemins[next(numeros)])
+            temporaire = os.path.join(dossier, ".{}.{}".format(os.getpid(), nom_image))
+            plt.imsave(temporaire, image)
+            os.replace(temporaire, os.path.join(dossier, nom_image))
+
+        pipeline = Pipeline(self.__traces(temps_list, snb or self.snb, multi, bcorrige, tolerance_angle),
+                            [("rasteriser", rasteriser), ("ecrire", ecrire)], taille_file, nom_source="trace")
+        try:
+            pipeline.executer()
+        finally:
+            if flux is not None:
+                nom = flux.fermer()
+        self.info_pipeline = pipeline.stats()
+        return nom if flux is not None else chemins
+
+    def save_video(self, nom, nb_frame=None, temps_list=None, canevas=None, images_par_seconde=20, direction='a',
+                   snb=None, multi=10, bcorrige=False, styles=None):
+        """
+        Tracer, dessiner (voir raster_frames) et encoder (voir FluxVideo) les images une a une : une seule image est en
+        memoire a la fois, et ffmpeg encode pendant qu'on trace la suivante
+        :param nom: le nom du fichier, voir FluxVideo
+        :param nb_frame: nombre d'images de temps 0 a 1, comme dans play
+        :param temps_list: ou bien les temps des images
+        Les autres parametres sont ceux de raster_frames
+        :return: le nom du fichier ecrit
+        """
+        if temps_list is None:
+            if nb_frame is None:
+                raise ValueError("Error: il faut donner nb_frame ou temps_list")
+            temps_list = np.linspace(0, 1, nb_frame)
+        if len(temps_list) == 0:
+            raise ValueError("Error: aucune image a ecrire")
+        images = self.raster_frames(temps_list, canevas, direction, snb, multi, bcorrige, styles)
+        canevas = next(images)
+        with FluxVideo(nom, canevas.largeur, canevas.hauteur, images_par_seconde) as flux:
+            flux.ajouter(canevas.image)
+            for canevas in images:
+                flux.ajouter(canevas.image)
+        return flux.nom
+
     """Getter"""
 
     def gfsym(self):
         return self.__expr
 
+    def gdfsym(self):
+        """
+        :return: (df_sym, df_reci_sym) les expressions symboliques des differentiels (df_reci_sym peut etre None)
+        """
+        if self.__df_sym is None:
+            df_srepr, df_reci_srepr = self.__df_srepr
+            self.__df_sym = sp.sympify(df_srepr)
+            self.__df_reci_sym = sp.sympify(df_reci_srepr) if df_reci_srepr is not None else None
+        return self.__df_sym, self.__df_reci_sym
+
     def gfnum(self):
         return self.__num
 
@@ -947,9 +1821,1516 @@ class DiffeoInfini:
         et qui retourne le differentiel (matrice jacobienne) dans ce point.
         :param x_num:
         :param y_num:
-        :return:
+        :return: Jacobienne
         """
-        return self.__df_num(x_num, y_num)
+        return Jacobienne(self.__df_num(x_num, y_num), np.broadcast(x_num, y_num).shape)
+
+    def f_df(self, x_num, y_num):
+        """
+        Calculer f et df dans les memes points. Avec l'option fusion, c'est un seul noyau ou les sous-expressions
+        communes aux deux (par ex. exp(-b(x²+y²)), cos(θg) et sin(θg) pour f_ex2) ne sont calculees qu'une fois ;
+        sinon, on appelle f puis df.
+        :param x_num: float ou numpy.array
+        :param y_num: float ou numpy.array
+        :return: ((f1, f2), df), df etant une Jacobienne
+        """
+        forme = np.broadcast(x_num, y_num).shape
+        if self.__f_df_num is None:
+            return self.__etendre(self.__num(x_num, y_num), forme), self.df(x_num, y_num)
+        f1, f2, a, b, c, d = self.__f_df_num(x_num, y_num)
+        return self.__etendre((f1, f2), forme), Jacobienne([a, b, c, d], forme)
+
+
+class Jacobienne:
+    """
+    La matrice jacobienne [[∂f1/∂x, ∂f1/∂y], [∂f2/∂x, ∂f2/∂y]] d'un diffeomorphisme en chaque point d'une grille.
+    Chaque composante est gardee telle que le noyau la retourne : une composante constante (par ex. ∂f1/∂x = 1 pour
+    f_ex) reste un scalaire, une composante calculee sur des axes creux et qui ne depend que d'une variable reste de
+    forme (1, snb) ou (snb, 1). On ne l'etend a la forme de la grille (par numpy.broadcast_to, sans copie) que quand on
+    la lit, et les calculs qui utilisent directement composantes ne font rien pour les composantes triviales.
+    On la lit comme le tableau numpy de forme (2, 2, ligne, colonne) qu'elle remplace : jac[0][0], jac[1, 0]...
+    """
+
+    def __init__(self, composantes, forme):
+        """
+        :param composantes: [∂f1/∂x, ∂f1/∂y, ∂f2/∂x, ∂f2/∂y], scalaires ou tableaux
+        :param forme: la forme de la grille
+        """
+        self.composantes = list(composantes)
+        self.forme = tuple(forme)
+
+    def __getitem__(self, indice):
+        if isinstance(indice, tuple):
+            i, j = indice
+            v = self.composantes[2 * i + j]
+            return v if np.shape(v) == self.forme else np.broadcast_to(v, self.forme)
+        return [self[indice, 0], self[indice, 1]]
+
+    def __iter__(self):
+        yield self[0]
+        yield self[1]
+
+    def __len__(self):
+        return 2
+
+    def constante(self, i, j):
+        """
+        :return: True si la composante (i, j) ne depend pas du point
+        """
+        return np.ndim(self.composantes[2 * i + j]) == 0
+
+    @property
+    def shape(self):
+        return (2, 2) + self.forme
+
+    @property
+    def nbytes(self):
+        return sum(np.asarray(v).nbytes for v in self.composantes)
+
+    def __array__(self, dtype=None, copy=None):
+        return np.array([[self[0, 0], self[0, 1]], [self[1, 0], self[1, 1]]], dtype=dtype)
+
+    def __repr__(self):
+        return "Jacobienne({})".format(np.asarray(self))
+
+
+class CacheGrilles:
+    """
+    Cache LRU des resultats calcules sur une grille (plan, tab_f, tab_df, tab_angles_R...). Chaque resultat est range
+    sous sa propre cle (quantite, snb, t0, t1, multi, ...), on peut donc garder plusieurs resolutions a la fois, par ex.
+    snb=50 pour tracer et snb=500 pour dessiner. Quand la memoire occupee depasse budget, on oublie les resultats les
+    moins recemment utilises.
+    Les statistiques sont dans les attributs succes, echecs, evictions et octets (voir aussi stats).
+    """
+
+    def __init__(self, budget=512 * 1024 * 1024, transfert_max=None):
+        """
+        :param budget: memoire maximale en octets
+        :param transfert_max: taille maximale en octets d'un resultat transmis par pickle, voir __getstate__
+        """
+        self.budget = budget
+        self.transfert_max = transfert_max
+        self._entrees = OrderedDict()
+        self.octets = 0
+        self.succes = 0
+        self.echecs = 0
+        self.evictions = 0
+
+    @staticmethod
+    def taille_octets(valeur, vus=None):
+        """
+        Une vue (par ex. etendue par numpy.broadcast_to, dont nbytes est celui de la forme etendue) compte pour le
+        tableau qui possede ses donnees, et un tableau partage par plusieurs vues de valeur n'est compte qu'une fois
+        :param vus: les id des tableaux deja comptes
+        :return: la memoire occupee par les tableaux numpy contenus dans valeur (tableau, tuple ou liste de tableaux)
+        """
+        if vus is None:
+            vus = set()
+        if isinstance(valeur, (tuple, list)):
+            return sum(CacheGrilles.taille_octets(v, vus) for v in valeur)
+        while isinstance(valeur, np.ndarray) and isinstance(valeur.base, np.ndarray):
+            valeur = valeur.base
+        if id(valeur) in vus:
+            return 0
+        vus.add(id(valeur))
+        return getattr(valeur, "nbytes", 0)
+
+    def __contains__(self, cle):
+        return cle in self._entrees
+
+    def __len__(self):
+        return len(self._entrees)
+
+    def obtenir(self, cle, calcul):
+        """
+        Retourner le resultat range sous cle, ou le calculer par calcul() et le ranger s'il n'y est pas
+        :param cle: tuple
+        :param calcul: fonction sans argument
+        :return: le resultat
+        """
+        if cle in self._entrees:
+            self._entrees.move_to_end(cle)
+            self.succes += 1
+            return self._entrees[cle][0]
+        self.echecs += 1
+        valeur = calcul()
+        self.mettre(cle, valeur)
+        return valeur
+
+    def mettre(self, cle, valeur):
+        """
+        Ranger valeur sous cle, puis oublier les resultats les moins recemment utilises jusqu'a respecter le budget.
+        Un resultat plus gros que le budget a lui seul n'est pas garde.
+        """
+        if cle in self._entrees:
+            self.octets -= self._entrees.pop(cle)[1]
+        taille = self.taille_octets(valeur)
+        if taille > self.budget:
+            return
+        self._entrees[cle] = (valeur, taille)
+        self.octets += taille
+        while self.octets > self.budget:
+            self.octets -= self._entrees.popitem(last=False)[1][1]
+            self.evictions += 1
+
+    def oublier(self, quantites=None):
+        """
+        Oublier tous les resultats des quantites donnees, ou tous les resultats si quantites est None
+        :param quantites: tuple de noms de quantites
+        """
+        for cle in list(self._entrees):
+            if quantites is None or cle[0] in quantites:
+                self.octets -= self._entrees.pop(cle)[1]
+
+    def partager(self, taille_min=0):
+        """
+        Remplacer les tableaux des resultats d'au moins taille_min octets par des copies en memoire partagee
+        :param taille_min: int
+        """
+        for cle, (valeur, taille) in self._entrees.items():
+            self._entrees[cle] = (_partager(valeur, taille_min), taille)
+
+    def __getstate__(self):
+        """
+        Un tableau en memoire partagee est transmis par son nom, un tableau etendu par numpy.broadcast_to par sa forme
+        compacte ; un resultat qui reste plus gros que transfert_max n'est pas transmis du tout, et sera recalcule.
+        Les statistiques ne sont pas transmises.
+        :return: dict
+        """
+        etat = self.__dict__.copy()
+        etat["_entrees"] = []
+        etat["succes"], etat["echecs"], etat["evictions"] = 0, 0, 0
+        for cle, (valeur, taille) in self._entrees.items():
+            emballe = _emballer(valeur)
+            if self.transfert_max is None or self.taille_octets(emballe) <= self.transfert_max:
+                etat["_entrees"].append((cle, emballe, taille))
+        return etat
+
+    def __setstate__(self, etat):
+        entrees = etat.pop("_entrees")
+        self.__dict__.update(etat)
+        self._entrees = OrderedDict()
+        self.octets = 0
+        for cle, emballe, taille in entrees:
+            try:
+                self._entrees[cle] = (_deballer(emballe), taille)
+            except FileNotFoundError:
+                # le bloc partage a deja ete libere par le processus qui l'a cree
+                continue
+            self.octets += taille
+
+    def stats(self):
+        """
+        :return: dict des statistiques du cache
+        """
+        return {"succes": self.succes, "echecs": self.echecs, "evictions": self.evictions, "octets": self.octets,
+                "entrees": len(self._entrees), "budget": self.budget}
+
+
+def _evincer(dossier, extension, taille_max):
+    """
+    Supprimer les fichiers d'extension extension du dossier d'un cache, les moins recemment utilises (date de
+    modification) d'abord, jusqu'a ce que leur taille totale ne depasse plus taille_max
+    """
+    entrees = []
+    for nom in os.listdir(dossier):
+        if nom.endswith(extension):
+            info = os.stat(os.path.join(dossier, nom))
+            entrees.append((info.st_mtime, info.st_size, nom))
+    total = sum(e[1] for e in entrees)
+    for _, taille, nom in sorted(entrees):
+        if total <= taille_max:
+            break
+        os.remove(os.path.join(dossier, nom))
+        total -= taille
+
+
+class CacheNoyaux:
+    """
+    Cache sur le disque des noyaux compiles par sp.lambdify. Chaque entree est un fichier json, nomme par le hash
+    (sha256) du srepr des expressions, des variables, du module numerique et de la version de sympy, qui contient les
+    codes sources generes et les srepr des differentiels. Quand la taille totale du dossier depasse taille_max, on
+    supprime les entrees les moins recemment utilisees.
+    FORMAT change quand la forme des noyaux generes change, pour ne pas relire des entrees d'un ancien format.
+    """
+    FORMAT = 2
+
+    def __init__(self, dossier, taille_max=16 * 1024 * 1024):
+        """
+        :param dossier: le dossier du cache, cree s'il n'existe pas
+        :param taille_max: taille maximale du dossier en octets
+        """
+        self.dossier = dossier
+        self.taille_max = taille_max
+        os.makedirs(dossier, exist_ok=True)
+
+    @staticmethod
+    def cle(expr, expr_reci, vars_sym, module, fusion):
+        contenu = json.dumps([sp.srepr(expr), sp.srepr(expr_reci) if expr_reci is not None else None,
+                              sp.srepr(tuple(vars_sym)), module, bool(fusion), sp.__version__,
+                              CacheNoyaux.FORMAT])
+        return hashlib.sha256(contenu.encode("utf-8")).hexdigest()
+
+    def _chemin(self, cle):
+        return os.path.join(self.dossier, cle + ".json")
+
+    def charger(self, cle):
+        """
+        :param cle: str, voir cle
+        :return: le dict sauve sous cette cle, ou None s'il n'y en a pas
+        """
+        chemin = self._chemin(cle)
+        try:
+            with open(chemin, encoding="utf-8") as fichier:
+                sources = json.load(fichier)
+        except (OSError, ValueError):
+            return None
+        # on met a jour la date de modification, qui sert de date de derniere utilisation pour l'eviction
+        os.utime(chemin)
+        return sources
+
+    def sauver(self, cle, sources):
+        """
+        :param cle: str, voir cle
+        :param sources: dict a sauver, serialisable en json
+        """
+        chemin = self._chemin(cle)
+        # on ecrit dans un fichier temporaire puis on le renomme, pour qu'un autre processus ne lise jamais un fichier
+        # a moitie ecrit
+        temp = "{}.{}.tmp".format(chemin, os.getpid())
+        with open(temp, "w", encoding="utf-8") as fichier:
+            json.dump(sources, fichier)
+        os.replace(temp, chemin)
+        self.evincer()
+
+    def evincer(self):
+        """
+        Supprimer les entrees les moins recemment utilisees jusqu'a ce que le dossier ne depasse plus taille_max
+        """
+        _evincer(self.dossier, ".json", self.taille_max)
+
+    @staticmethod
+    def compiler(source):
+        """
+        Recompiler une fonction generee par sp.lambdify(..., "numpy") a partir de son code source
+        :param source: str
+        :return: la fonction de python
+        """
+        espace = {"I": 1j}
+        exec("from numpy import *", espace)
+        # comme sp.lambdify, on enregistre le code dans linecache pour que inspect.getsource le retrouve
+        nom = "<noyau-{}>".format(hashlib.sha256(source.encode()).hexdigest()[:16])
+        linecache.cache[nom] = (len(source), None, source.splitlines(True), nom)
+        exec(compile(source, nom, "exec"), espace)
+        return espace["_lambdifygenerated"]
+
+
+class TraceSet:
+    """
+    Toutes les courbes d'une famille (par ex. les courbes horizontales d'un resultat de trace) dans un seul tableau de
+    points de forme (nb_points, 2), mis bout a bout, avec le tableau debuts de nb_courbes + 1 indices : la courbe i est
+    points[debuts[i]:debuts[i + 1]]. Un TraceSet se parcourt comme la liste de [tab_x, tab_y] qu'il remplace, mais
+    chaque courbe y est une vue sur points, sans copie.
+    """
+
+    def __init__(self, points, debuts):
+        """
+        :param points: numpy.array de forme (nb_points, 2)
+        :param debuts: numpy.array d'entiers de taille nb_courbes + 1, croissant. Il commence a 0 et finit a
+                       nb_points, sauf pour une tranche d'un autre TraceSet, qui partage ses points
+        """
+        self.points, self.debuts = points, debuts
+
+    @staticmethod
+    def depuis(courbes, dtype=float):
+        """
+        :param courbes: liste de [tab_x, tab_y] comme dans le resultat de trace, ou TraceSet
+        :param dtype: float, ou np.float32 pour deux fois moins de place
+        :return: TraceSet
+        """
+        if isinstance(courbes, TraceSet):
+            return TraceSet(courbes.points.astype(dtype, copy=False), courbes.debuts)
+        longueurs = [len(ligne[0]) for ligne in courbes]
+        debuts = np.zeros(len(longueurs) + 1, dtype=np.int64)
+        np.cumsum(longueurs, out=debuts[1:])
+        points = np.empty((debuts[-1], 2), dtype=dtype)
+        for ligne, debut, fin in zip(courbes, debuts[:-1], debuts[1:]):
+            points[debut:fin, 0] = ligne[0]
+            points[debut:fin, 1] = ligne[1]
+        return TraceSet(points, debuts)
+
+    def __len__(self):
+        return len(self.debuts) - 1
+
+    def __getitem__(self, indice):
+        """
+        :param indice: int, ou tranche (sans pas) de courbes
+        :return: [tab_x, tab_y] de la courbe indice, deux vues sur points ; ou TraceSet des courbes de la tranche,
+                 qui partage les points de celui-ci
+        """
+        if isinstance(indice, slice):
+            debut, fin, pas = indice.indices(len(self))
+            if pas != 1:
+                raise IndexError("Error: une tranche d'un TraceSet ne peut pas avoir de pas")
+            return TraceSet(self.points, self.debuts[debut:max(fin, debut) + 1])
+        if indice < 0:
+            indice += len(self)
+        if not 0 <= indice < len(self):
+            raise IndexError("Error: courbe {} d'un TraceSet de {} courbes".format(indice, len(self)))
+        morceau = self.points[self.debuts[indice]:self.debuts[indice + 1]]
+        return [morceau[:, 0], morceau[:, 1]]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def nbytes(self):
+        return self.points.nbytes + self.debuts.nbytes
+
+    def longueurs(self):
+        """
+        :return: le nombre de points de chaque courbe
+        """
+        return np.diff(self.debuts)
+
+    def tableaux(self):
+        """
+        :return: (points, debuts) de ses seules courbes, debuts commencant a 0 ; points est une vue
+        """
+        return self.points[self.debuts[0]:self.debuts[-1]], self.debuts - self.debuts[0]
+
+    def segments(self):
+        """
+        :return: les courbes comme LineCollection les attend : une vue (nb_courbes, nb_points, 2) sur points quand
+                 elles ont toutes le meme nombre de points (voir reechantillonner), sinon la liste des vues
+                 (nb_points, 2) de chaque courbe
+        """
+        longueurs = self.longueurs()
+        if len(longueurs) > 0 and (longueurs == longueurs[0]).all():
+            points, _ = self.tableaux()
+            return points.reshape(len(longueurs), longueurs[0], 2)
+        return [self.points[debut:fin] for debut, fin in zip(self.debuts[:-1], self.debuts[1:])]
+
+    def reechantillonner(self, nb_points):
+        """
+        Reechantillonner toutes les courbes a la fois, chacune par nb_points points regulierement espaces selon sa
+        longueur d'arc, comme _reechantillonner : la place et le cout du dessin ne dependent plus du pas du trace.
+        Les nouveaux points sont interpoles lineairement entre les points traces (et non par la sortie dense de
+        l'integrateur) : l'erreur est de l'ordre de la fleche d'un pas, bien en dessous d'un pixel pour les pas usuels.
+        Les courbes vides restent vides de points : leurs nb_points points sont nan
+        :return: TraceSet dont toutes les courbes ont nb_points points
+        """
+        points, debuts = self.tableaux()
+        nb_courbes = len(debuts) - 1
+        if nb_courbes == 0:
+            return TraceSet(np.empty((0, 2), dtype=points.dtype), np.zeros(1, dtype=np.int64))
+        debuts_nouveaux = np.arange(nb_courbes + 1, dtype=np.int64) * nb_points
+        if len(points) == 0:
+            return TraceSet(np.full((nb_courbes * nb_points, 2), np.nan, dtype=points.dtype), debuts_nouveaux)
+        longueurs = np.diff(debuts)
+        # longueur d'arc cumulee de tous les points mis bout a bout ; entre deux courbes, on compte un saut de 1 pour
+        # que l'arc reste strictement croissant d'une courbe a l'autre
+        pas = np.hypot(*np.diff(points, axis=0).T)
+        pas[~_continuite(debuts)] = 1.
+        arc = np.concatenate([[0.], np.cumsum(pas)])
+        # une courbe vide a la fin commence apres le dernier point : on la borne a celui-ci, elle est mise a nan plus bas
+        premier = arc[np.minimum(debuts[:-1], len(arc) - 1)]
+        total = arc[np.minimum(np.maximum(debuts[1:] - 1, debuts[:-1]), len(arc) - 1)] - premier
+        cible = (premier[:, None] + total[:, None] * np.linspace(0, 1, nb_points)).ravel()
+        resultat = np.empty((nb_courbes * nb_points, 2), dtype=points.dtype)
+        resultat[:, 0] = np.interp(cible, arc, points[:, 0])
+        resultat[:, 1] = np.interp(cible, arc, points[:, 1])
+        # une courbe vide n'a aucun point a interpoler
+        vides = np.nonzero(longueurs == 0)[0]
+        if len(vides) > 0:
+            resultat.reshape(nb_courbes, nb_points, 2)[vides] = np.nan
+        return TraceSet(resultat, debuts_nouveaux)
+
+    @staticmethod
+    def sauver_npz(fichier, traces, autres=None):
+        """
+        Sauver des TraceSet dans un seul .npz non compresse : le TraceSet nom y devient les tableaux nom et
+        nom_debuts. Sans compression, les tableaux peuvent etre relus par memory-map, voir charger_npz
+        :param fichier: nom ou fichier ouvert
+        :param traces: dict {nom: TraceSet}
+        :param autres: dict {nom: numpy.array} d'autres tableaux a sauver avec
+        """
+        donnees = dict(autres or {})
+        for nom, trace in traces.items():
+            donnees[nom], donnees[nom + "_debuts"] = trace.tableaux()
+        np.savez(fichier, **donnees)
+
+    @staticmethod
+    def charger_npz(fichier, mmap=False):
+        """
+        :param fichier: le nom d'un fichier ecrit par sauver_npz
+        :param mmap: si True, les tableaux ne sont pas lus mais projetes en memoire (numpy.memmap, en lecture seule) :
+                     seules les courbes qu'on regarde sont lues sur le disque. On ne peut pas y ecrire, mais on peut
+                     les passer a DiffeoInfini.corriger, qui ne modifie pas les courbes qu'on lui donne
+        :return: (dict {nom: TraceSet}, dict {nom: numpy.array} des autres tableaux)
+        """
+        if mmap:
+            tableaux = _projeter_npz(fichier)
+        else:
+            with np.load(fichier) as donnees:
+                tableaux = {nom: donnees[nom] for nom in donnees.files}
+        traces = {nom[:-len("_debuts")]: TraceSet(tableaux[nom[:-len("_debuts")]], tableaux[nom])
+                  for nom in tableaux if nom.endswith("_debuts")}
+        autres = {nom: tab for nom, tab in tableaux.items()
+                  if nom not in traces and not (nom.endswith("_debuts") and nom[:-len("_debuts")] in traces)}
+        return traces, autres
+
+
+class _Historique:
+    """
+    Les points d'un lot de courbes tracees ensemble (voir DiffeoInfini._runge_kutta_lot), ranges pas a pas dans deux
+    tableaux (rang du point, courbe) alloues d'avance, dont le nombre de lignes double quand ils sont pleins. A chaque
+    pas, seules les courbes qui avancent ecrivent leur nouveau point, au lieu de copier l'etat de tout le lot.
+    """
+
+    def __init__(self, depart_x, depart_y, nb_prevu):
+        """
+        :param depart_x: abscisses des points de depart, une par courbe
+        :param depart_y: ordonnees des points de depart, une par courbe
+        :param nb_prevu: nombre de points prevu pour la plus longue courbe
+        """
+        nb_courbes = len(depart_x)
+        self.tab_x = np.empty((max(int(nb_prevu), 1), nb_courbes))
+        self.tab_y = np.empty_like(self.tab_x)
+        self.tab_x[0], self.tab_y[0] = depart_x, depart_y
+        self.nb_points = np.ones(nb_courbes, dtype=np.intp)
+
+    def ajouter(self, courbes, tab_x, tab_y, rang=None):
+        """
+        :param courbes: les numeros des courbes qui avancent, sans doublon
+        :param tab_x: leurs nouveaux points
+        :param tab_y:
+        :param rang: le rang du nouveau point, s'il est le meme pour toutes ces courbes (a pas fixe, c'est le numero
+                     du pas)
+        """
+        if rang is None:
+            rang = self.nb_points[courbes]
+            dernier = rang.max() if len(rang) > 0 else 0
+        else:
+            dernier = rang
+        if dernier >= len(self.tab_x):
+            nb_lignes = max(2 * len(self.tab_x), dernier + 1)
+            for nom in ("tab_x", "tab_y"):
+                ancien = getattr(self, nom)
+                nouveau = np.empty((nb_lignes, ancien.shape[1]))
+                nouveau[:len(ancien)] = ancien
+                setattr(self, nom, nouveau)
+        self.tab_x[rang, courbes] = tab_x
+        self.tab_y[rang, courbes] = tab_y
+        self.nb_points[courbes] += 1
+
+    def courbes(self):
+        """
+        :return: [[tab_trace_x, tab_trace_y], ...] une courbe par point de depart, vues sur les tableaux
+        """
+        return [[self.tab_x[:nb, i], self.tab_y[:nb, i]] for i, nb in enumerate(self.nb_points)]
+
+
+class CacheTraces:
+    """
+    Cache sur le disque des resultats de DiffeoInfini.trace. Chaque entree est un fichier .npz (non compresse), nomme
+    par le hash (sha256) du diffeomorphisme, de l'intervalle et de tous les parametres du trace, qui contient un
+    TraceSet par famille (voir TraceSet.sauver_npz) ; on y garde aussi l'origine de chaque courbe quand le trace a ete
+    fait a partir d'un precedent. L'eviction est celle de CacheNoyaux (voir _evincer), mais par default la taille du
+    dossier n'est pas limitee : un trace coute bien plus cher que sa place sur le disque.
+    """
+    FORMAT = 1
+
+    def __init__(self, dossier, expr, expr_reci=None, vars_sym=(sp.symbols("x y")), taille_max=None):
+        """
+        :param dossier: le dossier du cache, cree s'il n'existe pas
+        :param expr: l'expression symbolique du diffeomorphisme
+        :param expr_reci: celle de sa reciproque
+        :param vars_sym: ses variables
+        :param taille_max: taille maximale du dossier en octets, None pour ne jamais rien supprimer
+        """
+        self.dossier = dossier
+        self.taille_max = taille_max
+        os.makedirs(dossier, exist_ok=True)
+        # le hash des expressions (srepr est lent) n'est calcule qu'une fois
+        self.empreinte = CacheNoyaux.cle(expr, expr_reci, vars_sym, "traces", False)
+
+    def cle(self, t0, t1, temps, taille, multi, precision, methode, tolerance, symetrique, deroulement, source_reci,
+            tolerance_angle=None):
+        """
+        :param deroulement: le deroulement des angles du champ, voir DiffeoInfini.tab_angles_R
+        :param source_reci: str, d'ou viennent les antecedents du plan (calcules, ou le hash de ceux qu'on a charges)
+        :param tolerance_angle: None pour un trace exact, sinon celui d'un trace a partir d'un precedent
+        :return: str
+        """
+        contenu = json.dumps([self.empreinte, float(t0), float(t1), float(temps), int(taille), int(multi),
+                              float(precision), methode, float(tolerance), bool(symetrique), deroulement, source_reci,
+                              tolerance_angle, CacheTraces.FORMAT])
+        return hashlib.sha256(contenu.encode("utf-8")).hexdigest()
+
+    def _chemin(self, cle):
+        return os.path.join(self.dossier, cle + ".npz")
+
+    def charger(self, cle):
+        """
+        :param cle: str, voir cle
+        :return: ([trace_h, trace_v], origines ou None), ou None s'il n'y a pas d'entree sous cette cle. Comme dans le
+                 resultat de trace, chaque famille est une liste de [tab_x, tab_y], ici des vues sur les tableaux lus
+        """
+        chemin = self._chemin(cle)
+        try:
+            traces, autres = TraceSet.charger_npz(chemin)
+            resultat = [list(traces["h"]), list(traces["v"])]
+        except (OSError, ValueError, KeyError):
+            return None
+        os.utime(chemin)
+        return resultat, autres.get("origines")
+
+    def sauver(self, cle, resultat, origines=None):
+        """
+        :param cle: str, voir cle
+        :param resultat: [trace_h, trace_v] comme retourne par trace
+        :param origines: l'origine de chaque courbe (voir DiffeoInfini.__retracer), ou None
+        """
+        autres = {} if origines is None else {"origines": np.asarray(origines, dtype=float)}
+        chemin = self._chemin(cle)
+        # meme extension, sinon numpy.savez ajoute .npz
+        temp = "{}.{}.tmp.npz".format(chemin[:-len(".npz")], os.getpid())
+        TraceSet.sauver_npz(temp, {"h": TraceSet.depuis(resultat[0]), "v": TraceSet.depuis(resultat[1])}, autres)
+        os.replace(temp, chemin)
+        if self.taille_max is not None:
+            self.evincer()
+
+    def evincer(self):
+        """
+        Supprimer les entrees les moins recemment utilisees jusqu'a ce que le dossier ne depasse plus taille_max
+        """
+        _evincer(self.dossier, ".npz", self.taille_max)
+
+
+class ChampAngles:
+    """
+    Interpolateur bilineaire d'un champ d'angles, construit une seule fois a partir du resultat de
+    DiffeoInfini.tab_angles_R, et qu'on peut interroger en un point ou en un tableau de points.
+    Pour chaque cellule de la grille, on precalcule les quatre coefficients (c0, cx, cy, cxy) tels que dans la cellule
+        angle = c0 + cx * t + cy * s + cxy * t * s
+    ou (t, s) sont les coordonnees du point dans la cellule. Les coefficients des deux familles (horizontale, puis
+    verticale) sont ranges dans un seul tableau contigu de forme (2 * taille * taille, 4), donc une requete ne coute
+    qu'un calcul d'indice et une lecture de ligne.
+    """
+
+    def __init__(self, tab_angles, t0, t1):
+        """
+        :param tab_angles: [horizontal ou vertical, ligne, colonne], comme retourne par tab_angles_R. Attention, les
+                           angles verticaux y sont ranges par (colonne, ligne)
+        :param t0: valeur minimale dans l'interval I
+        :param t1: valeur maximale dans l'interval I
+        """
+        self.taille = len(tab_angles[0])
+        self.t0, self.t1 = t0, t1
+        self.pas = (t1 - t0) / (self.taille - 1)
+        coefs = []
+        for tab in (np.asarray(tab_angles[0]), np.asarray(tab_angles[1]).T):
+            # au-dela de la derniere ligne ou colonne, l'angle est prolonge par constante, comme dans find_sim_points
+            ext = np.pad(tab, ((0, 1), (0, 1)), mode="edge")
+            a00, a10, a01, a11 = ext[:-1, :-1], ext[:-1, 1:], ext[1:, :-1], ext[1:, 1:]
+            coefs.append(np.stack([a00, a10 - a00, a01 - a00, a11 - a10 - a01 + a00], axis=-1).reshape(-1, 4))
+        self.coefs = np.ascontiguousarray(np.concatenate(coefs))
+
+    @property
+    def nbytes(self):
+        return self.coefs.nbytes
+
+    def __call__(self, tab_x, tab_y, famille=0):
+        """
+        Calculer l'angle interpole en (tab_x, tab_y)
+        :param tab_x: float ou numpy.array
+        :param tab_y: float ou numpy.array, de meme forme que tab_x
+        :param famille: 0 (ou False) pour le champ horizontal, 1 (ou True) pour le champ vertical. Peut etre un tableau
+                        de meme forme que tab_x, pour melanger les deux familles
+        :return: float si les arguments sont des scalaires, numpy.array sinon
+        """
+        if np.ndim(tab_x) == 0 and np.ndim(tab_y) == 0 and np.ndim(famille) == 0:
+            u = (tab_x - self.t0) / self.pas
+            v = (tab_y - self.t0) / self.pas
+            kx = min(max(math.floor(u), 0), self.taille - 1)
+            ky = min(max(math.floor(v), 0), self.taille - 1)
+            t, s = u - kx, v - ky
+            c0, cx, cy, cxy = self.coefs[(int(famille) * self.taille + ky) * self.taille + kx].tolist()
+            return c0 + cx * t + (cy + cxy * t) * s
+        u = (np.asarray(tab_x, dtype=float) - self.t0) / self.pas
+        v = (np.asarray(tab_y, dtype=float) - self.t0) / self.pas
+        kx = np.minimum(np.maximum(np.floor(u), 0), self.taille - 1).astype(int)
+        ky = np.minimum(np.maximum(np.floor(v), 0), self.taille - 1).astype(int)
+        t, s = u - kx, v - ky
+        c0, cx, cy, cxy = self.coefs[(np.asarray(famille, dtype=int) * self.taille + ky) * self.taille + kx].T
+        return c0 + cx * t + (cy + cxy * t) * s
+
+
+class GrilleSpatiale:
+    """
+    Index spatial d'un nuage de points du plan par une grille uniforme de cases : les points sont tries par case, et
+    self.debut[k] est l'indice du premier point de la case k dans ce tri (comme une matrice creuse en format CSR).
+    Pour trouver le point le plus proche d'une requete, on ne regarde que les cases autour de la sienne, en elargissant
+    l'anneau de cases tant que le meilleur candidat pourrait etre battu par un point hors des cases deja vues. Toutes
+    les requetes sont traitees en meme temps.
+    """
+
+    def __init__(self, tab_x, tab_y, nb_par_case=4):
+        """
+        :param tab_x: abscisses des points, numpy.array de forme quelconque
+        :param tab_y: ordonnees des points, de meme forme
+        :param nb_par_case: nombre moyen de points par case
+        """
+        tab_x = np.asarray(tab_x, dtype=float).ravel()
+        tab_y = np.asarray(tab_y, dtype=float).ravel()
+        self.x_min, self.y_min = tab_x.min(), tab_y.min()
+        etendue = max(tab_x.max() - self.x_min, tab_y.max() - self.y_min) or 1.
+        self.nb = max(1, int(math.sqrt(len(tab_x) / nb_par_case)))
+        # on elargit un peu les cases pour que le point maximal tombe dans la derniere case
+        self.cote = etendue / self.nb * (1 + 1e-9)
+        kx, ky = self._case(tab_x, tab_y)
+        cles = ky * self.nb + kx
+        self.ordre = np.argsort(cles, kind="stable")
+        self.debut = np.searchsorted(cles[self.ordre], np.arange(self.nb * self.nb + 1))
+        self.x, self.y = tab_x[self.ordre], tab_y[self.ordre]
+
+    def _case(self, tab_x, tab_y):
+        kx = np.clip(np.floor((tab_x - self.x_min) / self.cote), 0, self.nb - 1).astype(int)
+        ky = np.clip(np.floor((tab_y - self.y_min) / self.cote), 0, self.nb - 1).astype(int)
+        return kx, ky
+
+    def plus_proche(self, tab_x, tab_y):
+        """
+        Pour chaque point (tab_x, tab_y), trouver le point de l'index le plus proche
+        :param tab_x: abscisses des requetes, numpy.array de forme quelconque
+        :param tab_y: ordonnees des requetes, de meme forme
+        :return: (indices, distances) de meme forme que tab_x : indices dans le tableau (mis a plat) donne a __init__
+        """
+        forme = np.shape(tab_x)
+        qx = np.asarray(tab_x, dtype=float).ravel()
+        qy = np.asarray(tab_y, dtype=float).ravel()
+        kx, ky = self._case(qx, qy)
+        meilleur_d2 = np.full(len(qx), np.inf)
+        meilleur = np.zeros(len(qx), dtype=int)
+        restant = np.arange(len(qx))
+        rayon = 0
+        while len(restant) > 0:
+            # les cases de l'anneau a distance rayon (au sens de max(|dx|, |dy|)) de la case de chaque requete
+            dx, dy = np.meshgrid(np.arange(-rayon, rayon + 1), np.arange(-rayon, rayon + 1))
+            anneau = np.maximum(np.abs(dx), np.abs(dy)) == rayon
+            cx = kx[restant, np.newaxis] + dx[anneau]
+            cy = ky[restant, np.newaxis] + dy[anneau]
+            valide = (cx >= 0) & (cx < self.nb) & (cy >= 0) & (cy < self.nb)
+            cles = np.where(valide, cy * self.nb + cx, 0)
+            debut = self.debut[cles]
+            nombre = np.where(valide, self.debut[cles + 1] - debut, 0).ravel()
+            # tous les candidats de toutes les requetes, mis bout a bout
+            total = nombre.sum()
+            requete = np.repeat(np.repeat(np.arange(len(restant)), cx.shape[1]), nombre)
+            candidat = np.arange(total) + np.repeat(debut.ravel() - (np.cumsum(nombre) - nombre), nombre)
+            d2 = (self.x[candidat] - qx[restant][requete]) ** 2 + (self.y[candidat] - qy[restant][requete]) ** 2
+            if total > 0:
+                tri = np.lexsort((d2, requete))
+                premier = tri[np.r_[True, requete[tri][1:] != requete[tri][:-1]]]
+                req = restant[requete[premier]]
+                mieux = d2[premier] < meilleur_d2[req]
+                meilleur_d2[req[mieux]] = d2[premier][mieux]
+                meilleur[req[mieux]] = candidat[premier][mieux]
+            # distance de la requete au bord des cases deja vues ; un bord qui est celui de la grille ne compte pas
+            rx, ry, kx_, ky_ = qx[restant], qy[restant], kx[restant], ky[restant]
+            marge = np.full(len(restant), np.inf)
+            for bord, interieur in ((rx - (self.x_min + (kx_ - rayon) * self.cote), kx_ - rayon > 0),
+                                    (self.x_min + (kx_ + rayon + 1) * self.cote - rx, kx_ + rayon < self.nb - 1),
+                                    (ry - (self.y_min + (ky_ - rayon) * self.cote), ky_ - rayon > 0),
+                                    (self.y_min + (ky_ + rayon + 1) * self.cote - ry, ky_ + rayon < self.nb - 1)):
+                marge = np.where(interieur, np.minimum(marge, bord), marge)
+            restant = restant[~(meilleur_d2[restant] <= np.maximum(marge, 0) ** 2) & np.isfinite(marge)]
+            rayon += 1
+        return self.ordre[meilleur].reshape(forme), np.sqrt(meilleur_d2).reshape(forme)
+
+
+class Canevas:
+    """
+    Image RGB (numpy.array uint8 de forme (hauteur, largeur, 3)) ou l'on trace directement des courbes anti-crenelees,
+    sans passer par les figures de matplotlib. Chaque segment est echantillonne tous les pas pixels, et chaque
+    echantillon est reparti sur ses quatre pixels voisins (interpolation bilineaire) : la couverture de chaque pixel
+    est une somme calculee par un seul numpy.bincount pour toutes les courbes d'une couleur.
+    """
+    COULEURS = {'h': (31, 119, 180), 'v': (255, 127, 14)}
+
+    def __init__(self, largeur=1920, hauteur=1080, limites=(-1.1, 1.1, -1.1, 1.1), fond=(255, 255, 255), pas=1.):
+        """
+        :param largeur: en pixels
+        :param hauteur: en pixels
+        :param limites: (x_min, x_max, y_min, y_max) le rectangle du plan a afficher, centre dans l'image sans changer
+                        ses proportions
+        :param fond: la couleur du fond
+        :param pas: la distance en pixels entre deux echantillons d'un segment
+        """
+        self.largeur, self.hauteur, self.pas = largeur, hauteur, pas
+        self.fond = np.empty((hauteur, largeur, 3), dtype=np.uint8)
+        self.fond[:] = fond
+        self.image = self.fond.copy()
+        x_min, x_max, y_min, y_max = limites
+        self.echelle = min((largeur - 1) / (x_max - x_min), (hauteur - 1) / (y_max - y_min))
+        self.centre = np.array([(x_min + x_max) / 2, (y_min + y_max) / 2])
+
+    def effacer(self):
+        np.copyto(self.image, self.fond)
+
+    def pixels(self, points):
+        """
+        :param points: numpy.array de forme (n, 2) de points du plan
+        :return: numpy.array de forme (n, 2) de leurs coordonnees (colonne, ligne) dans l'image, l'axe y vers le haut
+        """
+        pixels = (points - self.centre) * self.echelle
+        pixels[:, 1] *= -1
+        return pixels + [(self.largeur - 1) / 2, (self.hauteur - 1) / 2]
+
+    def __decouper(self, debut, fin, marge):
+        """
+        Couper les segments [debut, fin] au bord de l'image elargie de marge pixels (Liang-Barsky, tous les segments a
+        la fois), pour ne pas echantillonner ce qui sort de l'image
+        :return: debut, fin des segments coupes, sans ceux qui sont entierement dehors
+        """
+        delta = fin - debut
+        t_min, t_max = np.zeros(len(debut)), np.ones(len(debut))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for axe, borne in ((0, self.largeur - 1 + marge), (1, self.hauteur - 1 + marge)):
+                for p, q in ((-delta[:, axe], debut[:, axe] + marge), (delta[:, axe], borne - debut[:, axe])):
+                    t = q / p
+                    dehors = (p == 0) & (q < 0)
+                    t_min = np.where(p < 0, np.maximum(t_min, t), t_min)
+                    t_max = np.where(p > 0, np.minimum(t_max, t), t_max)
+                    t_max[dehors] = -1.
+        garder = t_min < t_max
+        debut, delta, t_min, t_max = debut[garder], delta[garder], t_min[garder, None], t_max[garder, None]
+        return debut + t_min * delta, debut + t_max * delta
+
+    def tracer(self, courbes, couleur=(0, 0, 0), epaisseur=1.):
+        """
+        Tracer des courbes d'une meme couleur
+        :param courbes: liste de [tab_x, tab_y] (comme dans le resultat de trace), TraceSet, ou numpy.array de forme
+                        (nb_courbes, nb_points, 2)
+        :param couleur: (r, g, b) entre 0 et 255
+        :param epaisseur: en pixels
+        """
+        if isinstance(courbes, np.ndarray):
+            nb_points = courbes.shape[1]
+            points = courbes.reshape(-1, 2)
+            continu = np.ones(max(len(points) - 1, 0), dtype=bool)
+            continu[nb_points - 1::nb_points] = False
+        elif isinstance(courbes, TraceSet):
+            points, debuts = courbes.tableaux()
+            continu = _continuite(debuts)
+        else:
+            courbes = _segments(courbes)
+            if not courbes:
+                return
+            points = np.concatenate(courbes)
+            debuts = np.zeros(len(courbes) + 1, dtype=np.int64)
+            np.cumsum([len(ligne) for ligne in courbes], out=debuts[1:])
+            continu = _continuite(debuts)
+        points = self.pixels(np.asarray(points, dtype=float))
+        debut, fin = points[:-1][continu], points[1:][continu]
+        fini = np.isfinite(debut).all(axis=1) & np.isfinite(fin).all(axis=1)
+        debut, fin = self.__decouper(debut[fini], fin[fini], epaisseur + 1)
+        delta = fin - debut
+        longueur = np.hypot(delta[:, 0], delta[:, 1])
+        nb = np.maximum(np.ceil(longueur / self.pas), 1).astype(np.intp)
+        # l'echantillon j du segment s est au milieu du j-ieme morceau de s, et pese la longueur de ce morceau
+        segment = np.repeat(np.arange(len(nb)), nb)
+        rang = np.arange(len(segment)) - np.repeat(np.cumsum(nb) - nb, nb)
+        t = (rang + 0.5) / nb[segment]
+        echantillons = debut[segment] + t[:, None] * delta[segment]
+        poids = (longueur / nb)[segment]
+        if epaisseur > 1:
+            # plusieurs copies decalees le long de la normale du segment
+            with np.errstate(divide="ignore", invalid="ignore"):
+                normale = np.where(longueur[:, None] > 0, delta[:, ::-1] * [-1, 1] / longueur[:, None], 0)[segment]
+            decalages = np.linspace(-(epaisseur - 1) / 2, (epaisseur - 1) / 2, int(math.ceil(epaisseur)))
+            echantillons = (echantillons[None] + decalages[:, None, None] * normale[None]).reshape(-1, 2)
+            poids = np.tile(poids * epaisseur / len(decalages), len(decalages))
+        # l'image de couverture a un bord d'un pixel, pour que les quatre voisins d'un echantillon soient toujours dedans
+        large = self.largeur + 2
+        coin = np.floor(echantillons)
+        fraction = (echantillons - coin).astype(np.float32)
+        coin = coin.astype(np.intp) + 1
+        dedans = (coin[:, 0] >= 0) & (coin[:, 0] <= self.largeur) & (coin[:, 1] >= 0) & (coin[:, 1] <= self.hauteur)
+        if not dedans.all():
+            coin, fraction, poids = coin[dedans], fraction[dedans], poids[dedans]
+        if not len(coin):
+            return
+        # seule la bande de lignes touchees est comptee
+        premiere = coin[:, 1].min()
+        base = (coin[:, 1] - premiere) * large + coin[:, 0]
+        fx, fy, poids = fraction[:, 0], fraction[:, 1], poids.astype(np.float32)
+        indices = np.concatenate([base, base + 1, base + large, base + large + 1])
+        poids_pixels = np.concatenate([poids * (1 - fx) * (1 - fy), poids * fx * (1 - fy), poids * (1 - fx) * fy,
+                                       poids * fx * fy])
+        couverture = np.bincount(indices, poids_pixels)
+        # on ne melange que les pixels touches, chacun une seule fois, sans ceux du bord
+        touches = np.flatnonzero(couverture)
+        ligne, colonne = np.divmod(touches, large)
+        ligne += premiere - 1
+        colonne -= 1
+        dedans = (ligne >= 0) & (ligne < self.hauteur) & (colonne >= 0) & (colonne < self.largeur)
+        alpha = np.minimum(couverture[touches[dedans]], 1.).astype(np.float32)[:, None]
+        touches = ligne[dedans] * self.largeur + colonne[dedans]
+        plat = self.image.reshape(-1, 3)
+        melange = plat[touches] * (1 - alpha) + np.asarray(couleur, dtype=np.float32) * alpha + 0.5
+        plat[touches] = melange.astype(np.uint8)
+
+    def tracer_trace(self, resultat, direction='a', styles=None):
+        """
+        :param resultat: [trace_h, trace_v] comme retourne par trace
+        :param direction: 'h', 'v' ou 'a' pour les deux
+        :param styles: {'h': dict, 'v': dict} les options de tracer (couleur, epaisseur) de chaque famille
+        """
+        styles = styles or {}
+        for nom, courbes in zip(('h', 'v'), resultat):
+            if direction in (nom, 'a'):
+                style = {"couleur": self.COULEURS[nom]}
+                style.update(styles.get(nom, {}))
+                self.tracer(courbes, **style)
+
+    def tracer_grille(self, tab_x, tab_y, direction='a', styles=None):
+        """
+        Tracer une grille comme celle de tab_f : les lignes de tab_x, tab_y sont les courbes horizontales, leurs
+        colonnes les courbes verticales
+        """
+        self.tracer_trace([np.stack([tab_x, tab_y], axis=-1), np.stack([tab_x.T, tab_y.T], axis=-1)], direction,
+                          styles)
+
+    def sauver_png(self, nom):
+        plt.imsave(nom, self.image)
+
+    def ecrire(self, flux):
+        """
+        Ecrire l'image brute (rgb24, ligne par ligne) dans un fichier binaire ou un tube, par ex. l'entree de ffmpeg
+        """
+        flux.write(memoryview(self.image).cast("B"))
+
+
+class FluxVideo:
+    """
+    Ecrire une suite d'images RGB dans un fichier au fur et a mesure, sans jamais les garder toutes en memoire.
+    Pour une video (.mp4, .webm, .avi...), les images brutes sont envoyees par un tube a un processus ffmpeg, qui
+    encode en meme temps qu'on trace l'image suivante. Sans ffmpeg, ou pour un nom en .npy, les images sont ajoutees
+    a la suite d'un fichier .npy de forme (nb_images, hauteur, largeur, 3), lisible par numpy.load(mmap_mode='r').
+    Si ffmpeg s'arrete en cours de route, ajouter leve RuntimeError avec son code de retour et ce qu'il a ecrit sur
+    stderr.
+    S'utilise avec with, ou en appelant fermer a la fin.
+    """
+    # place reservee a l'entete du .npy, reecrit a la fin quand on connait le nombre d'images
+    TAILLE_ENTETE = 128
+
+    def __init__(self, nom, largeur, hauteur, images_par_seconde=20, ffmpeg=None):
+        """
+        :param nom: le nom du fichier ; son extension choisit le format
+        :param largeur: en pixels, paire pour la plupart des codecs de ffmpeg
+        :param hauteur: en pixels, paire pour la plupart des codecs de ffmpeg
+        :param images_par_seconde:
+        :param ffmpeg: le chemin de ffmpeg, cherche dans le PATH par default
+        """
+        self.largeur, self.hauteur, self.nb_images = largeur, hauteur, 0
+        self.processus, self.erreurs = None, None
+        ffmpeg = ffmpeg or shutil.which("ffmpeg")
+        if not nom.endswith(".npy") and ffmpeg is None:
+            nom = os.path.splitext(nom)[0] + ".npy"
+            print("Attention: ffmpeg introuvable, les images sont ecrites dans {}".format(nom))
+        self.nom = nom
+        if nom.endswith(".npy"):
+            self.fichier = open(nom, "wb")
+            self.fichier.write(self.__entete())
+        else:
+            # stderr dans un fichier et non un tube : un tube plein bloquerait ffmpeg pendant qu'on ecrit dans stdin
+            self.erreurs = tempfile.TemporaryFile()
+            self.processus = subprocess.Popen([ffmpeg, "-loglevel", "error", "-y", "-f", "rawvideo", "-pix_fmt", "rgb24",
+                                               "-s", "{}x{}".format(largeur, hauteur), "-r", str(images_par_seconde),
+                                               "-i", "-", "-pix_fmt", "yuv420p", nom], stdin=subprocess.PIPE,
+                                              stderr=self.erreurs)
+            self.fichier = self.processus.stdin
+
+    def __entete(self):
+        entete = "{{'descr': '|u1', 'fortran_order': False, 'shape': ({}, {}, {}, 3), }}".format(
+            self.nb_images, self.hauteur, self.largeur)
+        debut = np.lib.format.magic(1, 0)
+        place = self.TAILLE_ENTETE - len(debut) - 2
+        return debut + place.to_bytes(2, "little") + entete.ljust(place - 1).encode("latin1") + b"\n"
+
+    def ajouter(self, image):
+        """
+        :param image: numpy.array uint8 de forme (hauteur, largeur, 3), par ex. Canevas.image
+        """
+        if image.shape != (self.hauteur, self.largeur, 3) or image.dtype != np.uint8:
+            raise ValueError("Error: image de forme {} et de type {}, attendu ({}, {}, 3) uint8".format(
+                image.shape, image.dtype, self.hauteur, self.largeur))
+        try:
+            self.fichier.write(memoryview(np.ascontiguousarray(image)).cast("B"))
+        except BrokenPipeError:
+            raise RuntimeError(self.__arreter_ffmpeg() or "Error: ffmpeg a ferme son entree") from None
+        self.nb_images += 1
+
+    def fermer(self):
+        """
+        :return: le nom du fichier ecrit
+        """
+        if self.fichier.closed:
+            return self.nom
+        if self.processus is None:
+            self.fichier.seek(0)
+            self.fichier.write(self.__entete())
+            self.fichier.close()
+        else:
+            message = self.__arreter_ffmpeg()
+            if message is not None:
+                print(message)
+        return self.nom
+
+    def __arreter_ffmpeg(self):
+        """
+        Fermer le tube vers ffmpeg et attendre qu'il finisse
+        :return: None si ffmpeg s'est bien termine, sinon le message d'erreur, avec son code et son stderr
+        """
+        try:
+            self.fichier.close()
+        except BrokenPipeError:
+            # ffmpeg s'est deja arrete : son code et son stderr disent pourquoi
+            pass
+        code = self.processus.wait()
+        self.erreurs.seek(0)
+        sortie = self.erreurs.read().decode("utf-8", "replace").strip()
+        self.erreurs.close()
+        if code == 0:
+            return None
+        return "Error: ffmpeg s'est arrete avec le code {} : {}".format(code, sortie)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fermer()
+
+
+class Pipeline:
+    """
+    Enchainer des etages, chacun dans son thread, relies par des files bornees (queue.Queue) : chaque etage traite
+    l'element suivant pendant que l'etage d'apres traite le precedent. Les calculs de numpy, la compression des PNG et
+    les ecritures liberent le GIL, donc les etages avancent vraiment en meme temps. Une file pleine bloque l'etage qui
+    la remplit : au plus taille_file elements attendent entre deux etages.
+    Si un etage leve une exception, tous les etages s'arretent et executer la releve.
+    """
+    _FIN = object()
+
+    def __init__(self, source, etages, taille_file=4, nom_source="source"):
+        """
+        :param source: iterable des elements d'entree, parcouru par le premier etage
+        :param etages: liste de (nom, fonction) : chaque fonction recoit le resultat de l'etage precedent
+        :param taille_file: nombre maximal d'elements dans chaque file
+        :param nom_source: le nom du premier etage dans stats
+        """
+        self.source, self.etages = source, list(etages)
+        self.files = [queue.Queue(taille_file) for _ in self.etages]
+        self.arret = threading.Event()
+        self.erreur = None
+        self.compteurs = OrderedDict((nom, {"elements": 0, "occupe": 0., "attente": 0.})
+                                     for nom in [nom_source] + [nom for nom, _ in self.etages])
+        self.duree = None
+
+    def __mettre(self, file, element, compteur):
+        debut = time.perf_counter()
+        while not self.arret.is_set():
+            try:
+                file.put(element, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+        compteur["attente"] += time.perf_counter() - debut
+
+    def __prendre(self, file, compteur):
+        debut = time.perf_counter()
+        element = self._FIN
+        while not self.arret.is_set():
+            try:
+                element = file.get(timeout=0.1)
+                break
+            except queue.Empty:
+                pass
+        compteur["attente"] += time.perf_counter() - debut
+        return element
+
+    def __executer_etage(self, indice):
+        compteur = list(self.compteurs.values())[indice]
+        sortie = self.files[indice] if indice < len(self.files) else None
+        if indice == 0:
+            elements = iter(self.source)
+        else:
+            fonction, entree = self.etages[indice - 1][1], self.files[indice - 1]
+        try:
+            while not self.arret.is_set():
+                if indice == 0:
+                    debut = time.perf_counter()
+                    element = next(elements, self._FIN)
+                else:
+                    element = self.__prendre(entree, compteur)
+                    debut = time.perf_counter()
+                    if element is not self._FIN:
+                        element = fonction(element)
+                if element is self._FIN:
+                    break
+                compteur["occupe"] += time.perf_counter() - debut
+                compteur["elements"] += 1
+                if sortie is not None:
+                    self.__mettre(sortie, element, compteur)
+        except BaseException as erreur:
+            if self.erreur is None:
+                self.erreur = erreur
+            self.arret.set()
+        finally:
+            # apres un arret, la source (par ex. un generateur de traces) n'est plus parcourue
+            if indice == 0 and hasattr(elements, "close"):
+                elements.close()
+        if sortie is not None:
+            self.__mettre(sortie, self._FIN, compteur)
+
+    def executer(self):
+        """
+        Faire passer tous les elements de source par tous les etages, et attendre la fin
+        """
+        debut = time.perf_counter()
+        threads = [threading.Thread(target=self.__executer_etage, args=(i,), daemon=True)
+                   for i in range(len(self.compteurs))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.duree = time.perf_counter() - debut
+        if self.erreur is not None:
+            raise self.erreur
+
+    def stats(self):
+        """
+        :return: dict {nom de l'etage: {"elements", "occupe" (secondes de travail), "attente" (secondes passees a
+                 attendre une file), "debit" (elements par seconde de travail)}}, et "duree" : le temps total
+        """
+        stats = OrderedDict()
+        for nom, compteur in self.compteurs.items():
+            stats[nom] = dict(compteur, debit=compteur["elements"] / compteur["occupe"] if compteur["occupe"] else 0.)
+        stats["duree"] = self.duree
+        return stats
+
+
+class TableauPartage:
+    """
+    Proprietaire d'un bloc multiprocessing.shared_memory vu comme un numpy.array : d'autres processus ouvrent le bloc
+    par son nom et ecrivent directement dedans (voir _evaluer_bande), rien n'est pickle au retour. Le tableau retourne
+    par creer a ce proprietaire pour base ; le bloc est ferme (et supprime par le processus qui l'a cree) quand le
+    tableau et toutes ses vues ont disparu.
+    """
+
+    def __init__(self, forme, dtype=float, nom=None):
+        """
+        :param forme: la forme du tableau
+        :param dtype: le type des elements
+        :param nom: le nom d'un bloc existant a ouvrir, None pour en creer un nouveau
+        """
+        self.forme, self.dtype = tuple(forme), np.dtype(dtype)
+        taille = max(int(np.prod(self.forme)) * self.dtype.itemsize, 1)
+        self.createur = nom is None
+        self.memoire = shared_memory.SharedMemory(name=nom, create=self.createur, size=taille)
+        # numpy lit l'adresse du bloc dans __array_interface__ et garde ce proprietaire comme base du tableau, sans
+        # garder de vue exportee sur le bloc, qui pourra donc etre ferme
+        adresse = np.frombuffer(self.memoire.buf, dtype=np.uint8).ctypes.data
+        self.__array_interface__ = {"shape": self.forme, "typestr": self.dtype.str, "data": (adresse, False),
+                                    "version": 3}
+
+    @staticmethod
+    def creer(forme, dtype=float, nom=None):
+        """
+        :return: numpy.array de forme forme, dont la memoire est partagee
+        """
+        return np.asarray(TableauPartage(forme, dtype, nom))
+
+    def __del__(self):
+        self.memoire.close()
+        if self.createur:
+            self.memoire.unlink()
+
+
+class _Emballe:
+    """
+    Un tableau tel qu'il est transmis par pickle (voir CacheGrilles.__getstate__)
+        nature "partage": donnees est le nom du bloc partage
+        nature "etendu": donnees est la forme compacte du tableau, qu'on etend par numpy.broadcast_to
+    """
+
+    def __init__(self, nature, donnees, forme, dtype):
+        self.nature, self.donnees, self.forme, self.dtype = nature, donnees, forme, dtype
+
+    @property
+    def nbytes(self):
+        return getattr(self.donnees, "nbytes", 0)
+
+
+def _projeter_npz(fichier):
+    """
+    Projeter en memoire (numpy.memmap en lecture seule) chaque tableau d'un .npz non compresse : dans l'archive zip,
+    chaque .npy est stocke tel quel, a la suite de son entete local
+    :return: dict {nom: numpy.memmap}
+    """
+    tableaux = {}
+    with zipfile.ZipFile(fichier) as archive, open(fichier, "rb") as brut:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError("Error: {} est compresse dans {}, il ne peut pas etre projete".format(info.filename,
+                                                                                                       fichier))
+            # l'entete local fait 30 octets, suivis du nom et du champ extra, dont les longueurs sont aux octets 26-29
+            brut.seek(info.header_offset + 26)
+            long_nom, long_extra = np.frombuffer(brut.read(4), dtype="<u2")
+            brut.seek(info.header_offset + 30 + int(long_nom) + int(long_extra))
+            if np.lib.format.read_magic(brut) == (1, 0):
+                forme, fortran, dtype = np.lib.format.read_array_header_1_0(brut)
+            else:
+                forme, fortran, dtype = np.lib.format.read_array_header_2_0(brut)
+            nom = info.filename[:-len(".npy")]
+            if int(np.prod(forme)) == 0:
+                # on ne peut pas projeter zero octet
+                tableaux[nom] = np.empty(forme, dtype=dtype)
+            else:
+                tableaux[nom] = np.memmap(fichier, dtype=dtype, mode="r", offset=brut.tell(), shape=forme,
+                                          order="F" if fortran else "C")
+    return tableaux
+
+
+def _parcourir(valeur, transformer):
+    """
+    Appliquer transformer a chaque numpy.array contenu dans valeur (tableau, tuple, liste ou Jacobienne)
+    """
+    if isinstance(valeur, (tuple, list)):
+        return type(valeur)(_parcourir(v, transformer) for v in valeur)
+    if isinstance(valeur, Jacobienne):
+        return Jacobienne(_parcourir(valeur.composantes, transformer), valeur.forme)
+    if isinstance(valeur, ChampAngles):
+        copie = copy.copy(valeur)
+        copie.coefs = _parcourir(valeur.coefs, transformer)
+        return copie
+    if isinstance(valeur, (np.ndarray, _Emballe)):
+        return transformer(valeur)
+    return valeur
+
+
+def _emballer(valeur):
+    def transformer(tab):
+        if isinstance(tab.base, TableauPartage) and tab.shape == tab.base.forme:
+            return _Emballe("partage", tab.base.memoire.name, tab.shape, tab.dtype)
+        if 0 in tab.strides and tab.size > 0:
+            compact = tab[tuple(slice(None) if pas else slice(0, 1) for pas in tab.strides)]
+            return _Emballe("etendu", np.ascontiguousarray(compact), tab.shape, tab.dtype)
+        return tab
+
+    return _parcourir(valeur, transformer)
+
+
+def _deballer(valeur):
+    def transformer(tab):
+        if not isinstance(tab, _Emballe):
+            return tab
+        if tab.nature == "partage":
+            return TableauPartage.creer(tab.forme, tab.dtype, tab.donnees)
+        return np.broadcast_to(tab.donnees, tab.forme)
+
+    return _parcourir(valeur, transformer)
+
+
+def _partager(valeur, taille_min):
+    def transformer(tab):
+        if isinstance(tab.base, TableauPartage) or 0 in tab.strides or tab.nbytes < taille_min:
+            return tab
+        partage = TableauPartage.creer(tab.shape, tab.dtype)
+        partage[...] = tab
+        return partage
+
+    return _parcourir(valeur, transformer)
+
+
+def _segments(courbes):
+    """
+    :param courbes: liste de [tab_x, tab_y] (comme dans le resultat de trace), TraceSet, ou numpy.array de forme
+                    (nb_courbes, nb_points, 2)
+    :return: les courbes comme LineCollection les attend : un tableau (nb_courbes, nb_points, 2) contigu quand toutes
+             les courbes ont le meme nombre de points, sinon une liste de tableaux (nb_points, 2)
+    """
+    if isinstance(courbes, np.ndarray):
+        return courbes
+    if isinstance(courbes, TraceSet):
+        return courbes.segments()
+    return [np.column_stack(ligne) for ligne in courbes]
+
+
+def _continuite(debuts):
+    """
+    :param debuts: les indices de debut des courbes mises bout a bout, puis le nombre total de points, comme dans
+                   TraceSet.tableaux
+    :return: masque des nb_points - 1 segments entre deux points consecutifs : False quand le second point commence
+             une autre courbe. Une courbe vide ne coupe rien, elle a le meme debut que la suivante
+    """
+    nb_points = int(debuts[-1])
+    continu = np.ones(max(nb_points - 1, 0), dtype=bool)
+    coupures = debuts[1:-1]
+    continu[coupures[(coupures > 0) & (coupures < nb_points)] - 1] = False
+    return continu
+
+
+def collection_courbes(courbes, style=None):
+    """
+    Regrouper des courbes dans une seule LineCollection, au lieu d'une Line2D par courbe
+    :param courbes: voir _segments
+    :param style: dict des options de LineCollection (colors, linewidths, linestyles, alpha...). Par default, les
+                  courbes prennent l'une apres l'autre les couleurs du cycle de matplotlib, comme avec plt.plot
+    :return: LineCollection
+    """
+    options = {"colors": plt.rcParams["axes.prop_cycle"].by_key()["color"]}
+    options.update(style or {})
+    return LineCollection(_segments(courbes), **options)
+
+
+def dessiner_courbes(familles, ax=None, styles=None):
+    """
+    Dessiner chaque famille de courbes par une seule LineCollection
+    :param familles: dict {nom de la famille ('h', 'v'...): courbes}, voir _segments
+    :param ax: les axes, plt.gca() par default
+    :param styles: dict {nom de la famille: style}, voir collection_courbes
+    :return: dict {nom de la famille: LineCollection}
+    """
+    ax = ax or plt.gca()
+    styles = styles or {}
+    collections = {}
+    for nom, courbes in familles.items():
+        collections[nom] = ax.add_collection(collection_courbes(courbes, styles.get(nom)))
+    ax.autoscale_view()
+    return collections
+
+
+def _nb_points_prevu(depart_x, depart_y, verticale, t1, precision):
+    """
+    :return: le nombre de points prevu de la plus longue courbe d'un lot : une courbe horizontale va de son x de depart
+             a t1 par pas d'environ precision (un peu plus si elle ondule), une courbe verticale de son y de depart a t1
+    """
+    depart = np.where(verticale, depart_y, depart_x)
+    if len(depart) == 0:
+        return 1
+    return int(max(t1 - depart.min(), 0) / precision * 1.25) + 2
+
+
+def _densifier(resultat, points_par_ligne):
+    """
+    :return: resultat de trace, ou chaque famille reechantillonnee par points_par_ligne points par courbe si on le
+             donne
+    """
+    if points_par_ligne is None:
+        return resultat
+    return [TraceSet.depuis(famille).reechantillonner(points_par_ligne) for famille in resultat]
+
+
+def _reechantillonner(tab_x, tab_y, nb_points):
+    """
+    Reechantillonner une courbe par nb_points points regulierement espaces selon sa longueur d'arc
+    :return: (tab_x, tab_y) numpy.array
+    """
+    tab_x, tab_y = np.asarray(tab_x, dtype=float), np.asarray(tab_y, dtype=float)
+    arc = np.concatenate([[0.], np.cumsum(np.hypot(np.diff(tab_x), np.diff(tab_y)))])
+    if len(tab_x) == nb_points and arc[-1] == 0:
+        return tab_x, tab_y
+    cible = np.linspace(0, arc[-1], nb_points)
+    return np.interp(cible, arc, tab_x), np.interp(cible, arc, tab_y)
+
+
+def _remplir_par_tuiles(noyau, tab_x, tab_y, sorties, tuile):
+    """
+    Remplir sorties par noyau(tab_x, tab_y), tuile par tuile
+    :param sorties: liste de tableaux de forme (ligne, colonne), ou de scalaires pour les valeurs constantes, qu'on
+                    laisse tels quels
+    """
+    forme = next(np.shape(v) for v in sorties if np.ndim(v) != 0)
+
+    def morceau(tab, lignes, colonnes):
+        return tab[lignes if tab.shape[0] > 1 else slice(None), colonnes if tab.shape[1] > 1 else slice(None)]
+
+    for i in range(0, forme[0], tuile):
+        for j in range(0, forme[1], tuile):
+            lignes, colonnes = slice(i, i + tuile), slice(j, j + tuile)
+            valeurs = noyau(morceau(tab_x, lignes, colonnes), morceau(tab_y, lignes, colonnes))
+            for sortie, v in zip(sorties, valeurs):
+                if np.ndim(sortie) != 0:
+                    sortie[lignes, colonnes] = v
+
+
+# noyaux deja recompiles dans ce processus, par code source
+_noyaux_bandes = {}
+
+
+def _evaluer_bande(source, bande_x, bande_y, noms, forme, debut, fin, tuile):
+    """
+    Travail d'un processus de DiffeoInfini.__evaluer : calculer les lignes debut a fin et les ecrire dans les
+    TableauPartage de noms donnes
+    :param source: le code source du noyau, recompile une seule fois par processus
+    :param bande_x: les lignes debut a fin de tab_x (ou tab_x entier s'il est creux selon les lignes)
+    :param bande_y: idem pour tab_y
+    :param noms: noms des blocs partages des sorties, None pour une valeur constante
+    """
+    if source not in _noyaux_bandes:
+        _noyaux_bandes[source] = CacheNoyaux.compiler(source)
+    # les dtype ne servent qu'a ouvrir les blocs ; on les retrouve par un essai sur un point
+    essai = _noyaux_bandes[source](bande_x[:1, :1], bande_y[:1, :1])
+    sorties = [v if nom is None else TableauPartage.creer(forme, np.result_type(v), nom)[debut:fin]
+               for nom, v in zip(noms, essai)]
+    _remplir_par_tuiles(_noyaux_bandes[source], bande_x, bande_y, sorties, tuile)
+
+
+# le diffeomorphisme d'un processus de DiffeoInfini.render_frames
+_diffeo_rendu = None
+
+
+def _initialiser_rendu(diffeo):
+    global _diffeo_rendu
+    _diffeo_rendu = diffeo
+
+
+def _rendre_image(temps, chemin, options, diffeo=None):
+    """
+    Travail d'un processus de DiffeoInfini.render_frames : dessiner l'image de temps et la sauver sous chemin
+    :param diffeo: le diffeomorphisme, celui du processus (voir _initialiser_rendu) par default
+    """
+    dossier, nom = os.path.split(chemin)
+    # meme extension, pour que matplotlib choisisse le meme format
+    temporaire = os.path.join(dossier, ".{}.{}".format(os.getpid(), nom))
+    plt.clf()
+    (diffeo or _diffeo_rendu).draw_trace(temps, display=False, bsave=True, save_name=temporaire, **options)
+    os.replace(temporaire, chemin)
+
+
+def banc_parallele(expr, snb=4000, liste_processus=(1, 2, 4, 8), quantite="tab_df", tuile=None):
+    """
+    Mesurer le temps de calcul d'un tableau sur le plan selon le nombre de processus, et afficher l'acceleration et
+    l'efficacite par rapport a un seul processus
+    :param expr: l'expression symbolique du diffeomorphisme
+    :param snb: int
+    :param liste_processus: les nombres de processus a essayer
+    :param quantite: le nom de la methode de DiffeoInfini a mesurer, "tab_df" par default
+    :param tuile: voir DiffeoInfini
+    :return: dict {nombre de processus: temps en secondes}
+    """
+    temps = {}
+    for nb in liste_processus:
+        diffeo = DiffeoInfini(expr, tuile=tuile, processus=nb)
+        diffeo.plan(snb)
+        debut = time.perf_counter()
+        getattr(diffeo, quantite)(snb)
+        temps[nb] = time.perf_counter() - debut
+        acceleration = temps[liste_processus[0]] / temps[nb] * liste_processus[0]
+        print("{} processus : {:.3f} s, acceleration {:.2f}, efficacite {:.0%}".format(
+            nb, temps[nb], acceleration, acceleration / nb))
+    return temps
+
+
+def verifier_rendu(expr, temps_list, dossier, snb=20, multi=10, bcorrige=True, largeur=320, hauteur=240):
+    """
+    Comparer les images de save_video et de render_pipeline (qui tracent chaque image a partir de la precedente) a
+    des images tracees independamment par trace, puis corrigees par corriger, et dessinees dans le meme Canevas
+    :param expr: l'expression symbolique du diffeomorphisme
+    :param temps_list: les temps des images
+    :param dossier: le dossier des fichiers ecrits, cree s'il n'existe pas. Son sous-dossier "png" est vide avant
+                    render_pipeline, qui ne refait pas les images existantes
+    :param bcorrige: voir draw_trace
+    :return: l'ecart moyen (sur 255) de chaque image a son image de reference
+    """
+    os.makedirs(dossier, exist_ok=True)
+    diffeo, reference = DiffeoInfini(expr), DiffeoInfini(expr)
+    canevas = Canevas(largeur, hauteur)
+    images = {"save_video": np.load(diffeo.save_video(os.path.join(dossier, "verification.npy"),
+                                                      temps_list=temps_list, canevas=Canevas(largeur, hauteur),
+                                                      snb=snb, multi=multi, bcorrige=bcorrige), mmap_mode="r")}
+    dossier_png = os.path.join(dossier, "png")
+    shutil.rmtree(dossier_png, ignore_errors=True)
+    chemins = diffeo.render_pipeline(temps_list, out_dir=dossier_png, canevas=Canevas(largeur, hauteur), snb=snb,
+                                     multi=multi, bcorrige=bcorrige)
+    # plt.imread rend des flottants entre 0 et 1, avec la couche alpha
+    images["render_pipeline"] = [np.round(plt.imread(chemin)[..., :3] * 255) for chemin in chemins]
+    ecarts = []
+    for i, temps in enumerate(temps_list):
+        resultat = reference.trace(temps, snb, multi)
+        if bcorrige:
+            resultat = reference.corriger(resultat)
+        canevas.effacer()
+        canevas.tracer_trace(resultat)
+        ecarts.append({nom: np.abs(tab[i].astype(float) - canevas.image).mean() for nom, tab in images.items()})
+        print("temps {:.3f} : {}".format(temps, ", ".join("{} {:.3f}".format(nom, ecart)
+                                                          for nom, ecart in ecarts[-1].items())))
+    return ecarts
+
+
+def verifier_pipeline(nb_elements=50, element_en_erreur=1):
+    """
+    Verifier qu'apres l'exception d'un etage, Pipeline ne parcourt plus sa source : l'etage "ecrire" leve une exception
+    sur l'element element_en_erreur, et on compte les elements que la source a donnes
+    :return: le nombre d'elements donnes par la source
+    """
+    donnes = [0]
+
+    def source():
+        for i in range(nb_elements):
+            donnes[0] += 1
+            yield i
+
+    def ecrire(element):
+        if element == element_en_erreur:
+            raise OSError("Error: ecriture de l'element {}".format(element))
+        return element
+
+    pipeline = Pipeline(source(), [("ecrire", ecrire)], taille_file=2)
+    try:
+        pipeline.executer()
+    except OSError as erreur:
+        print("exception relevee : {}".format(erreur))
+    else:
+        print("Error: l'exception de l'etage ecrire n'a pas ete relevee")
+    print("elements donnes par la source : {} sur {}".format(donnes[0], nb_elements))
+    if donnes[0] == nb_elements:
+        print("Error: la source a ete parcourue jusqu'au bout apres l'exception")
+    return donnes[0]
+
+
+def verifier_courbes_vides(largeur=64, hauteur=64):
+    """
+    Verifier qu'une courbe vide (au debut, au milieu ou a la fin) ne change pas le dessin de Canevas.tracer, qu'on
+    lui donne une liste de [tab_x, tab_y] ou un TraceSet, ni les autres courbes reechantillonnees par
+    TraceSet.reechantillonner
+    :return: l'ecart maximal entre les resultats avec et sans courbes vides
+    """
+    axe = np.linspace(-0.8, 0.8, 30)
+    courbes = [[axe, 0.5 * np.sin(3 * axe) + decalage] for decalage in (-0.3, 0., 0.3)]
+    vide = [np.empty(0), np.empty(0)]
+    canevas = Canevas(largeur, hauteur)
+    canevas.tracer(courbes)
+    reference = canevas.image.copy()
+    ecart = 0
+    for avec_vides in ([vide] + courbes, courbes[:1] + [vide] + courbes[1:], courbes + [vide, vide]):
+        for entree in (avec_vides, TraceSet.depuis(avec_vides)):
+            canevas.effacer()
+            canevas.tracer(entree)
+            ecart = max(ecart, int(np.abs(canevas.image.astype(int) - reference).max()))
+    # et le reechantillonnage d'un TraceSet ne melange pas les longueurs d'arc de deux courbes
+    attendu = TraceSet.depuis(courbes).reechantillonner(40).points
+    for avec_vides in ([vide] + courbes, courbes[:1] + [vide] + courbes[1:], courbes + [vide, vide]):
+        obtenu = TraceSet.depuis(avec_vides).reechantillonner(40)
+        pleines = [i for i, ligne in enumerate(avec_vides) if len(ligne[0]) > 0]
+        points = np.concatenate([obtenu.points[obtenu.debuts[i]:obtenu.debuts[i + 1]] for i in pleines])
+        ecart = max(ecart, float(np.abs(points - attendu).max()))
+    print("ecart maximal avec des courbes vides : {}".format(ecart))
+    return ecart
 
 
 def f_ex(a, b, x_sym=sp.Symbol('x'), y_sym=sp.Symbol('y')):
@@ -996,46 +3377,52 @@ def f_ex2(a, b, _theta, x_sym=sp.Symbol('x'), y_sym=sp.Symbol('y')):
     return r_ex2(_theta, g_sym, g_num, x_sym, y_sym)
 
 
-""" Zone de tester le code"""
-x, y = sp.symbols("x y")
-le_t0, le_t1, la_taille = -1, 1, 50
-expression = f_ex2(0.2, 5, 5 * math.pi)[0]
-
-# expr = x + 0.2 * sp.exp(-15 * (x ** 2 + y ** 2)), y + 0.045 * sp.exp(-10 * (x ** 2 + y ** 2))
-ex = DiffeoInfini(expression)
-ex.load_points_reci("tab_inverse.npy", le_t0, le_t1)
-print(ex.gfnum())
-# print(ex.f(0, 0))
-# print(ex.gfsym())
-# print(ex.df(0, 0))
-ex.draw()
-# ex.draw(mode="reci")
-# ex.draw('h')
-# ex.draw('v')
-# print(ex.tab_df())
-# ex.draw_df()
-# ex.draw_df('h')
-# ex.draw_df('v')
-# ex.draw('h', display=False)
-# ex.draw_df('h', mode="reci")
-# ex.draw('v', display=False)
-# ex.draw_df('v', mode="reci")
-# ex.draw_all()
-# ex.draw_all('h')
-# ex.draw_all('v')
-# print(ex.tab_df(la_taille))
-# print(ex.tab_angles_R(la_taille))
-# ex.draw_angles_ligne('h', taille=la_taille, indice=la_taille // 4, val_min=-0.01, val_max=0.01)
-# ex.draw_angles_ligne('v', taille=la_taille, indice=la_taille // 4, val_min=-0.01, val_max=0.01)
-# ani = ex.play_angles('h', bsave=True, save_name="angles_reci")
-plt.title("Tracage par la methode de Runge-Kutta")
-ex.draw_trace(1, bcorrige=False, symetric=False)
-plt.title("Tracage par la methode d'Euler")
-ex.draw_trace(1, bcorrige=False, methode="euler", symetric=False)
-# ex.draw_trace(0.8, bcorrige=False, symetric=True)
-"""
-nb = 0
-for i in np.linspace(0, 1, 60):
-    ex.draw_trace(i, display=False, bcorrige=False, bsave=True, save_name=str(nb) + ".png",symetric=True)
-    nb += 1
-"""
+if __name__ == "__main__":
+    """ Zone de tester le code"""
+    x, y = sp.symbols("x y")
+    le_t0, le_t1, la_taille = -1, 1, 50
+    expression = f_ex2(0.2, 5, 5 * math.pi)[0]
+
+    # expr = x + 0.2 * sp.exp(-15 * (x ** 2 + y ** 2)), y + 0.045 * sp.exp(-10 * (x ** 2 + y ** 2))
+    ex = DiffeoInfini(expression)
+    ex.load_points_reci("tab_inverse.npy", le_t0, le_t1)
+    print(ex.gfnum())
+    # print(ex.f(0, 0))
+    # print(ex.gfsym())
+    # print(ex.df(0, 0))
+    ex.draw()
+    # ex.draw(mode="reci")
+    # ex.draw('h')
+    # ex.draw('v')
+    # print(ex.tab_df())
+    # ex.draw_df()
+    # ex.draw_df('h')
+    # ex.draw_df('v')
+    # ex.draw('h', display=False)
+    # ex.draw_df('h', mode="reci")
+    # ex.draw('v', display=False)
+    # ex.draw_df('v', mode="reci")
+    # ex.draw_all()
+    # ex.draw_all('h')
+    # ex.draw_all('v')
+    # print(ex.tab_df(la_taille))
+    # print(ex.tab_angles_R(la_taille))
+    # ex.draw_angles_ligne('h', taille=la_taille, indice=la_taille // 4, val_min=-0.01, val_max=0.01)
+    # ex.draw_angles_ligne('v', taille=la_taille, indice=la_taille // 4, val_min=-0.01, val_max=0.01)
+    # ani = ex.play_angles('h', bsave=True, save_name="angles_reci")
+    plt.title("Tracage par la methode de Runge-Kutta")
+    ex.draw_trace(1, bcorrige=False, symetric=False)
+    plt.title("Tracage par la methode d'Euler")
+    ex.draw_trace(1, bcorrige=False, methode="euler", symetric=False)
+    # ex.draw_trace(0.8, bcorrige=False, symetric=True)
+    # banc_parallele(expression, snb=4000, liste_processus=(1, 2, 4, 8, 16, 32))
+    # ex.render_frames(np.linspace(0, 1, 60), "images", workers=8, symetric=True)
+    # verifier_rendu(expression, np.linspace(0.8, 1, 5), "verification")
+    # verifier_pipeline()
+    # verifier_courbes_vides()
+    """
+    nb = 0
+    for i in np.linspace(0, 1, 60):
+        ex.draw_trace(i, display=False, bcorrige=False, bsave=True, save_name=str(nb) + ".png",symetric=True)
+        nb += 1
+    """
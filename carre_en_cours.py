@@ -28,6 +28,8 @@ import sympy as sp
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
 
+from carre_class import dessiner_courbes
+
 #matplotlib inline
 plt.rc('figure', figsize=(12,9))
 
@@ -130,9 +132,8 @@ def grille_unite(eps=0.05,show=True):
         fig1 = plt.figure()
         plt.title("GRILLE UNITÉ")
         
-        for ligne_h in Fh:
-            for ligne_v in Fv:
-                plt.plot(ligne_h,ligne_v)
+        #une seule LineCollection par feuilletage au lieu d'un plt.plot par ligne, avec le cycle de couleurs de plt.plot
+        dessiner_courbes({'h':np.array(Fh,dtype=float),'v':np.array(Fv,dtype=float)})
         
     return Fh, Fv
 
@@ -150,31 +151,24 @@ def grille_diff(f_expr,eps=0.05,show=True):
     Fh_diff=Fh.copy()
     Fv_diff=Fv.copy()
     
+    lignes_h = [] #lignes horizontales à plotter
+    lignes_v = [] #lignes verticales à plotter
+    
     for ligne_h in Fh_diff: #y fixés
         ligne_h = [evaluate_f(f_expr,p[0],p[1]) for p in ligne_h]        
         
         if show:
-            X = [] #abscisses à plotter
-            Y = [] #ordonnées à plotter
-            
-            for i in range(len(ligne_h)):
-                X.append(ligne_h[i][0])
-                Y.append(ligne_h[i][1])
-            
-            plt.plot(X,Y)
+            lignes_h.append(np.array(ligne_h,dtype=float))
     
     for ligne_v in Fv: #x fixés
         ligne_v = [evaluate_f(f_expr,p[0],p[1]) for p in ligne_v]
         
         if show:
-            X = [] #abscisses à plotter
-            Y = [] #ordonnées à plotter
-            
-            for i in range(len(ligne_v)):
-                X.append(ligne_v[i][0])
-                Y.append(ligne_v[i][1])
-            
-            plt.plot(X,Y)
+            lignes_v.append(np.array(ligne_v,dtype=float))
+    
+    if show:
+        #une seule LineCollection par feuilletage au lieu d'un plt.plot par ligne, avec le cycle de couleurs de plt.plot
+        dessiner_courbes({'h':np.array(lignes_h),'v':np.array(lignes_v)})
             
     return Fh_diff, Fv_diff
 